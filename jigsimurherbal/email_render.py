@@ -0,0 +1,475 @@
+"""
+Email rendering
+
+Email templates are rendered by their own template engine whose loader
+inlines the CSS of each template's <style> blocks, and of the templates it
+extends, into the elements' style attributes when the template is loaded.
+The engine caches compiled templates, so the stylesheet is parsed and
+inlined once per template per process rather than for every recipient, and
+only the rules that can't be inlined (:hover, @media, descendant selectors)
+stay in the <style> block.
+
+The inliner understands tag, .class and #id selectors and descendant
+combinators, matched within a single template file. Anything fancier is
+left in the <style> block, with !important so it still beats the inlined
+styles for clients that read it.
+
+The plain-text part is built by HTMLToText, a streaming converter that
+keeps line structure and link targets, instead of strip_tags, which also
+kept the stylesheet.
+"""
+
+import re
+import threading
+from html import unescape
+from html.parser import HTMLParser
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates
+from django.template.loaders import filesystem
+from django.template.utils import get_app_template_dirs
+from django.utils.autoreload import file_changed
+
+COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+STYLE_BLOCK_RE = re.compile(r"<style[^>]*>(.*?)</style>\s*", re.S | re.I)
+STYLE_ATTR_RE = re.compile(r"""(\sstyle\s*=\s*)(["'])(.*?)\2""", re.S | re.I)
+EXTENDS_RE = re.compile(r"""{%\s*extends\s+(["'])(.+?)\1\s*%}""")
+COMPOUND_RE = re.compile(r"^([a-z][a-z0-9]*)?((?:[.#][\w-]+)*)$", re.I)
+
+VOID_ELEMENTS = {"area", "base", "br", "col", "hr", "img", "input", "link", "meta"}
+
+
+# CSS
+
+
+def _split_rules(css):
+    """Yield (prelude, body) for each top-level rule, braces balanced"""
+    css = COMMENT_RE.sub("", css)
+    pos = 0
+    while True:
+        start = css.find("{", pos)
+        if start == -1:
+            return
+        depth, end = 1, start + 1
+        while depth and end < len(css):
+            if css[end] == "{":
+                depth += 1
+            elif css[end] == "}":
+                depth -= 1
+            end += 1
+        yield " ".join(css[pos:start].split()), css[start + 1 : end - 1]
+        pos = end
+
+
+def _declarations(body):
+    declarations = []
+    for declaration in body.split(";"):
+        prop, _, value = declaration.partition(":")
+        if prop.strip() and value.strip():
+            declarations.append((prop.strip().lower(), " ".join(value.split())))
+    return declarations
+
+
+def _parse_selector(selector):
+    """A selector as a list of (tag, classes, ids), or None if it can't be inlined"""
+    parts = []
+    for compound in selector.split():
+        match = COMPOUND_RE.match(compound)
+        if not match:
+            return None
+        tag, rest = match.groups()
+        parts.append(
+            (
+                tag.lower() if tag else None,
+                set(re.findall(r"\.([\w-]+)", rest)),
+                set(re.findall(r"#([\w-]+)", rest)),
+            )
+        )
+    return parts or None
+
+
+def _important(prelude, body):
+    if prelude.startswith("@"):
+        inner = " ".join(_important(p, b) for p, b in _split_rules(body))
+    else:
+        inner = "; ".join(
+            (
+                f"{prop}: {value}"
+                if value.endswith("!important")
+                else f"{prop}: {value} !important"
+            )
+            for prop, value in _declarations(body)
+        )
+    return f"{prelude} {{ {inner} }}"
+
+
+class Stylesheet:
+    """One <style> block: the rules to inline and the CSS to keep"""
+
+    def __init__(self, css):
+        self.rules = []  # (specificity, parts, declarations)
+        kept = []
+        for prelude, body in _split_rules(css):
+            if prelude.startswith("@"):
+                kept.append(_important(prelude, body))
+                continue
+            declarations = _declarations(body)
+            pseudo = descendant = False
+            for selector in prelude.split(","):
+                parts = _parse_selector(selector)
+                if parts is None:
+                    pseudo = True
+                    continue
+                descendant = descendant or len(parts) > 1
+                specificity = (
+                    sum(len(ids) for _, _, ids in parts),
+                    sum(len(classes) for _, classes, _ in parts),
+                    sum(1 for tag, _, _ in parts if tag),
+                )
+                self.rules.append((specificity, parts, declarations))
+            if pseudo:
+                kept.append(_important(prelude, body))
+            elif descendant:
+                # Inlined where the ancestors are in the same file, kept
+                # for where they aren't
+                inner = "; ".join(f"{p}: {v}" for p, v in declarations)
+                kept.append(f"{prelude} {{ {inner} }}")
+        self.kept = "\n".join(kept)
+
+
+def _matches(compound, element):
+    tag, classes, ids = compound
+    return (
+        (tag is None or tag == element[0])
+        and classes <= element[1]
+        and ids <= element[2]
+    )
+
+
+def _selector_matches(parts, element, ancestors):
+    if not _matches(parts[-1], element):
+        return False
+    remaining = parts[:-1]
+    for ancestor in reversed(ancestors):
+        if not remaining:
+            break
+        if _matches(remaining[-1], ancestor):
+            remaining = remaining[:-1]
+    return not remaining
+
+
+class _Inliner(HTMLParser):
+    def __init__(self, source, rules):
+        super().__init__(convert_charrefs=False)
+        self.rules = rules
+        self.ancestors = []
+        self.edits = []
+        self.line_offsets = [0] + [m.end() for m in re.finditer("\n", source)]
+
+    def handle_starttag(self, tag, attrs):
+        element = self._inline(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.ancestors.append(element)
+
+    def handle_startendtag(self, tag, attrs):
+        self._inline(tag, attrs)
+
+    def handle_endtag(self, tag):
+        for i in range(len(self.ancestors) - 1, -1, -1):
+            if self.ancestors[i][0] == tag:
+                del self.ancestors[i:]
+                break
+
+    def _inline(self, tag, attrs):
+        attrs = dict(attrs)
+        # Template variables in class or id can't be matched, skip them
+        element = (
+            tag,
+            {c for c in (attrs.get("class") or "").split() if "{" not in c},
+            {i for i in (attrs.get("id") or "").split() if "{" not in i},
+        )
+        matched = sorted(
+            (specificity, order, declarations)
+            for order, (specificity, parts, declarations) in enumerate(self.rules)
+            if _selector_matches(parts, element, self.ancestors)
+        )
+        if not matched:
+            return element
+
+        styles = {}
+        for _, _, declarations in matched:
+            for prop, value in declarations:
+                styles.pop(prop, None)
+                styles[prop] = value
+
+        raw = self.get_starttag_text()
+        existing = STYLE_ATTR_RE.search(raw)
+        quote = existing.group(2) if existing else '"'
+        if existing:
+            # The element's own style attribute still wins
+            for prop, _ in _declarations(existing.group(3)):
+                styles.pop(prop, None)
+        other_quote = "'" if quote == '"' else '"'
+        inlined = "; ".join(
+            f"{prop}: {value.replace(quote, other_quote)}"
+            for prop, value in styles.items()
+        )
+        if existing:
+            own = existing.group(3).strip()
+            style = f"{inlined}; {own}" if own else inlined
+            new = (
+                raw[: existing.start(3)] + style + raw[existing.end(3) :]
+                if styles
+                else raw
+            )
+        else:
+            end = len(raw) - (2 if raw.endswith("/>") else 1)
+            new = f'{raw[:end].rstrip()} style="{inlined}"{raw[end:]}'
+
+        line, column = self.getpos()
+        self.edits.append((self.line_offsets[line - 1] + column, len(raw), new))
+        return element
+
+
+def inline_css(source, stylesheets):
+    """Inline ``stylesheets`` into the HTML (or template) ``source``"""
+    rules = [rule for stylesheet in stylesheets for rule in stylesheet.rules]
+    if rules:
+        inliner = _Inliner(source, rules)
+        inliner.feed(source)
+        inliner.close()
+        for offset, length, new in reversed(inliner.edits):
+            source = source[:offset] + new + source[offset + length :]
+
+    def keep_uninlined(match):
+        kept = Stylesheet(match.group(1)).kept
+        return f"<style>\n{kept}\n</style>\n" if kept else ""
+
+    return STYLE_BLOCK_RE.sub(keep_uninlined, source)
+
+
+# Template loading
+
+
+class Loader(filesystem.Loader):
+    """Filesystem loader that inlines CSS into the templates it loads"""
+
+    def __init__(self, engine, dirs=None):
+        super().__init__(engine, dirs)
+        self.stylesheets = {}
+
+    def get_contents(self, origin):
+        source = super().get_contents(origin)
+        return inline_css(source, self.stylesheets_for(source))
+
+    def stylesheets_for(self, source, seen=()):
+        """The stylesheets of ``source`` and of the templates it extends"""
+        own = [Stylesheet(css) for css in STYLE_BLOCK_RE.findall(source)]
+        parent = EXTENDS_RE.search(source)
+        if not parent or parent.group(2) in seen:
+            return own
+        return self.stylesheets_of(parent.group(2), seen) + own
+
+    def stylesheets_of(self, template_name, seen=()):
+        if template_name not in self.stylesheets:
+            for origin in self.get_template_sources(template_name):
+                try:
+                    source = super().get_contents(origin)
+                except TemplateDoesNotExist:
+                    continue
+                self.stylesheets[template_name] = self.stylesheets_for(
+                    source, seen + (template_name,)
+                )
+                break
+            else:
+                raise TemplateDoesNotExist(template_name)
+        return self.stylesheets[template_name]
+
+    def reset(self):
+        self.stylesheets.clear()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_email_engine():
+    """The email template engine, configured like the site's Django engine"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                params = next(
+                    template
+                    for template in settings.TEMPLATES
+                    if template["BACKEND"].endswith("DjangoTemplates")
+                )
+                dirs = list(params.get("DIRS", []))
+                if params.get("APP_DIRS"):
+                    dirs += get_app_template_dirs("templates")
+                options = dict(params.get("OPTIONS", {}))
+                options["loaders"] = [
+                    (
+                        "django.template.loaders.cached.Loader",
+                        [("jigsimurherbal.email_render.Loader", dirs)],
+                    )
+                ]
+                _engine = DjangoTemplates(
+                    {
+                        "NAME": "emails",
+                        "DIRS": [],
+                        "APP_DIRS": False,
+                        "OPTIONS": options,
+                    }
+                )
+    return _engine
+
+
+def _inlining_loader():
+    return get_email_engine().engine.template_loaders[0].loaders[0]
+
+
+def get_email_template(template_name):
+    return get_email_engine().get_template(template_name)
+
+
+def email_from_string(source, styled_like):
+    """Compile an email fragment with the stylesheets of ``styled_like``"""
+    stylesheets = _inlining_loader().stylesheets_of(styled_like)
+    return get_email_engine().from_string(inline_css(source, stylesheets))
+
+
+def render_email(template_name, context):
+    """Render an email template, returning (html, plain text)"""
+    html = get_email_template(template_name).render(context)
+    return html, html_to_text(html)
+
+
+def reset_email_templates(sender, file_path, **kwargs):
+    # runserver reloads templates without restarting, drop ours too
+    if _engine is not None:
+        _engine.engine.template_loaders[0].reset()
+        _inlining_loader().reset()
+
+
+file_changed.connect(reset_email_templates, dispatch_uid="email_templates_changed")
+
+
+# Plain text
+
+TOKEN_RE = re.compile(
+    r"<!--.*?-->|<(/?)([a-zA-Z][a-zA-Z0-9]*)([^>]*)>|<[^>]*>|[^<]+", re.S
+)
+HREF_RE = re.compile(r"""\shref\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""", re.I)
+
+SKIPPED_ELEMENTS = {"head", "script", "style", "title"}
+PARAGRAPH_ELEMENTS = {
+    "address",
+    "blockquote",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "ol",
+    "p",
+    "table",
+    "ul",
+}
+LINE_ELEMENTS = {"article", "dd", "div", "dt", "footer", "header", "section", "tr"}
+
+
+class HTMLToText:
+    """Streaming HTML to plain text converter
+
+    Feed it HTML in as many pieces as you like, then call text(). Block
+    elements start new lines, list items get a dash and links are written
+    as "text (url)". It tokenizes with one regular expression rather than
+    html.parser, which is several times faster on email-sized documents.
+    """
+
+    def __init__(self):
+        self.out = []
+        self.pending = ""
+        self.skipping = None
+        self.links = []  # (href, position in out)
+
+    def feed(self, html):
+        html = self.pending + html
+        # Hold back a tag or comment split across pieces
+        cut = html.rfind("<!--")
+        if cut == -1 or "-->" in html[cut:]:
+            cut = html.rfind("<")
+            if cut != -1 and ">" in html[cut:]:
+                cut = -1
+        if cut == -1:
+            self.pending = ""
+        else:
+            html, self.pending = html[:cut], html[cut:]
+
+        for match in TOKEN_RE.finditer(html):
+            closing, tag, attrs = match.groups()
+            if tag is None:
+                token = match.group()
+                if not self.skipping and not token.startswith("<"):
+                    self.out.append(unescape(token))
+                continue
+            tag = tag.lower()
+            if self.skipping:
+                if closing and tag == self.skipping:
+                    self.skipping = None
+            elif closing:
+                self.end(tag)
+            else:
+                self.start(tag, attrs)
+                if attrs.endswith("/"):
+                    self.end(tag)
+
+    def start(self, tag, attrs):
+        if tag in SKIPPED_ELEMENTS:
+            self.skipping = tag
+        elif tag in PARAGRAPH_ELEMENTS:
+            self.out.append("\n\n")
+        elif tag in LINE_ELEMENTS or tag == "br":
+            self.out.append("\n")
+        elif tag == "li":
+            self.out.append("\n- ")
+        elif tag == "hr":
+            self.out.append("\n----------\n")
+        elif tag in ("td", "th"):
+            self.out.append(" ")
+        elif tag == "a":
+            href = HREF_RE.search(attrs)
+            href = next((g for g in href.groups() if g is not None), "") if href else ""
+            self.links.append((unescape(href), len(self.out)))
+
+    def end(self, tag):
+        if tag in PARAGRAPH_ELEMENTS:
+            self.out.append("\n\n")
+        elif tag in LINE_ELEMENTS or tag == "li":
+            self.out.append("\n")
+        elif tag == "a" and self.links:
+            href, start = self.links.pop()
+            content = "".join(self.out[start:])
+            label = content.rstrip()
+            target = href[len("mailto:") :] if href.startswith("mailto:") else href
+            if target and not target.startswith(("#", "javascript:")):
+                if target != " ".join(label.split()):
+                    # After the text, before any trailing whitespace
+                    self.out[start:] = [label, f" ({target})", content[len(label) :]]
+
+    def text(self):
+        lines = []
+        for line in "".join(self.out).split("\n"):
+            line = " ".join(line.split())
+            if line or (lines and lines[-1]):
+                lines.append(line)
+        return "\n".join(lines).strip()
+
+
+def html_to_text(html):
+    converter = HTMLToText()
+    converter.feed(html)
+    return converter.text()
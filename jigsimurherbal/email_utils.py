@@ -1,12 +1,67 @@
 """
 Email utilities for JigsimurHerbal
 Handles different types of emails with different sender addresses
+
+Emails are queued in the orders EmailOutbox and delivered by the
+run_email_worker command. Set EMAIL_DELIVERY = "sync" to send them during
+the request instead (e.g. in tests or local development). Either way they
+go out over pooled connections (see jigsimurherbal.mail_pool). Templates
+are rendered with jigsimurherbal.email_render.
 """
 
-from django.core.mail import send_mail, EmailMessage
+from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
+
+from .email_render import render_email
+from .mail_pool import get_connection_pool
+
+
+def build_email(subject, message, recipient_list, html_message=None):
+    email = EmailMultiAlternatives(
+        subject=subject,
+        body=message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=recipient_list,
+    )
+    if html_message:
+        email.attach_alternative(html_message, "text/html")
+    return email
+
+
+def send_now(emails):
+    """Send built emails in one batch, raising the first failure"""
+    errors = [e for e in get_connection_pool().send_messages(emails) if e]
+    if errors:
+        raise errors[0]
+    return len(emails)
+
+
+def deliver_email(subject, message, recipient_list, html_message=None):
+    """Queue an email, or send it right away in synchronous mode"""
+    if getattr(settings, "EMAIL_DELIVERY", "outbox") == "sync":
+        return send_now([build_email(subject, message, recipient_list, html_message)])
+
+    # Import here to avoid circular imports
+    from orders.outbox import enqueue_email
+
+    enqueue_email(subject, message, recipient_list, html_message)
+    return 1
+
+
+def deliver_emails(emails):
+    """Queue or send (subject, message, recipient_list, html_message) tuples
+
+    In synchronous mode they are sent in one batch over a pooled
+    connection instead of a connection each.
+    """
+    emails = list(emails)
+    if getattr(settings, "EMAIL_DELIVERY", "outbox") == "sync":
+        return send_now([build_email(*email) for email in emails])
+
+    from orders.outbox import enqueue_emails
+
+    enqueue_emails(emails)
+    return len(emails)
 
 
 class EmailService:
@@ -15,68 +70,43 @@ class EmailService:
     @staticmethod
     def send_order_notification(subject, message, recipient_list, html_message=None):
         """Send order-related emails (payment confirmations, order updates)"""
-        return send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=recipient_list,
-            html_message=html_message,
-            fail_silently=False,
-        )
+        return deliver_email(subject, message, recipient_list, html_message)
+
+    @staticmethod
+    def send_order_notifications(emails):
+        """Send a batch of order emails, as (subject, message, recipient_list,
+        html_message) tuples"""
+        return deliver_emails(emails)
 
     @staticmethod
     def send_support_email(subject, message, recipient_list, html_message=None):
         """Send customer support emails"""
-        return send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=recipient_list,
-            html_message=html_message,
-            fail_silently=False,
-        )
+        return deliver_email(subject, message, recipient_list, html_message)
 
     @staticmethod
     def send_system_email(subject, message, recipient_list, html_message=None):
         """Send system emails (password resets, notifications)"""
-        return send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=recipient_list,
-            html_message=html_message,
-            fail_silently=False,
-        )
+        return deliver_email(subject, message, recipient_list, html_message)
 
     @staticmethod
     def send_newsletter_email(subject, message, recipient_list, html_message=None):
         """Send newsletter and marketing emails"""
-        return send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=recipient_list,
-            html_message=html_message,
-            fail_silently=False,
-        )
+        return deliver_email(subject, message, recipient_list, html_message)
 
     @staticmethod
     def send_order_confirmation(order, customer_email):
         """Send order confirmation email"""
         subject = f"Order Confirmation - #{order.order_number}"
 
-        # Render HTML template
-        html_message = render_to_string(
-            "emails/order_confirmation.html",
+        html_message, plain_message = render_email(
+            "emails/orders/order_confirmation.html",
             {
                 "order": order,
                 "customer_email": customer_email,
+                "website_url": settings.SITE_URL,
             },
         )
 
-        # Plain text version
-        plain_message = strip_tags(html_message)
-
         return EmailService.send_order_notification(
             subject=subject,
             message=plain_message,
@@ -0,0 +1,135 @@
+"""
+Pooled email connections
+
+Opening an SMTP connection costs a TCP connect, a TLS handshake and a
+login, which is much slower than sending one message over it. The pool
+keeps a few connections open and hands them out for each batch of
+messages. A connection idle for longer than EMAIL_CONNECTION_MAX_IDLE
+seconds is closed rather than reused, since servers drop idle clients. A
+connection that drops mid-batch is reopened and the message it failed on
+is sent again.
+"""
+
+import logging
+import queue
+import smtplib
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = getattr(settings, "EMAIL_CONNECTION_POOL_SIZE", 2)
+MAX_IDLE = getattr(settings, "EMAIL_CONNECTION_MAX_IDLE", 30)
+
+# Errors that mean the connection is gone, not that the message is bad
+DISCONNECTED = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+# The server refused this message, but will take others
+REJECTED = (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError)
+
+
+def is_rejection(error):
+    """Whether a send_messages() error is about the message, not the server
+
+    Other errors (refused connections, failed logins, dropped connections)
+    would fail every message after it too.
+    """
+    return isinstance(error, REJECTED) or not isinstance(error, OSError)
+
+
+class ConnectionPool:
+    def __init__(self, size=POOL_SIZE, max_idle=MAX_IDLE, **connection_kwargs):
+        self.max_idle = max_idle
+        self.connection_kwargs = connection_kwargs
+        # (connection, time it was last used), most recently used last
+        self.idle = queue.LifoQueue(maxsize=size)
+
+    def _open(self):
+        connection = get_connection(fail_silently=False, **self.connection_kwargs)
+        connection.open()
+        return connection
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        while True:
+            try:
+                connection, last_used = self.idle.get_nowait()
+            except queue.Empty:
+                return self._open()
+            if time.monotonic() - last_used < self.max_idle:
+                return connection
+            self._close(connection)
+
+    def release(self, connection):
+        try:
+            self.idle.put_nowait((connection, time.monotonic()))
+        except queue.Full:
+            self._close(connection)
+
+    def send_messages(self, messages):
+        """Send ``messages`` over one connection
+
+        Returns a list with, for each message, None if it was sent or the
+        exception it failed with.
+        """
+        try:
+            connection = self.acquire()
+        except Exception as e:
+            return [e] * len(messages)
+
+        results = []
+        for message in messages:
+            try:
+                results.append(self._send(connection, message))
+            except Exception as e:
+                # The connection dropped and couldn't be reopened
+                self._close(connection)
+                return results + [e] * (len(messages) - len(results))
+        self.release(connection)
+        return results
+
+    def _send(self, connection, message):
+        try:
+            connection.send_messages([message])
+            return None
+        except DISCONNECTED as e:
+            logger.info("Email connection dropped, reconnecting: %s", e)
+            self._close(connection)
+        except Exception as e:
+            return e
+
+        connection.open()
+        try:
+            connection.send_messages([message])
+            return None
+        except Exception as e:
+            return e
+
+    def close(self):
+        while True:
+            try:
+                connection, _ = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(connection)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_connection_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
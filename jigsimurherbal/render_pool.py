@@ -0,0 +1,81 @@
+"""
+Process pool for bulk email rendering
+
+Rendering templates is CPU-bound, so however many threads a process runs it
+renders on one core. RenderPool hands chunks of work, lists of recipient or
+notification ids, to worker processes that set Django up once when they
+start, and streams the results back in order. A few chunks are kept in
+flight, so the workers render the next chunks while the caller sends the
+last one.
+
+Workers are started with "spawn" rather than forked, so they never share
+the parent's database connections. Spawned workers import the parent's
+main module, so start pools from manage.py commands, whose main module
+doesn't run anything on import.
+"""
+
+import multiprocessing
+import signal
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+RENDER_PROCESSES = getattr(settings, "EMAIL_RENDER_PROCESSES", 0)
+
+
+def _setup_worker():
+    import django
+
+    # Ctrl-C is for the parent, which stops after its current batch
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    django.setup()
+
+
+class RenderPool:
+    def __init__(self, processes=RENDER_PROCESSES, ahead=2):
+        self.processes = processes
+        # Chunks queued per worker beyond the one it is rendering
+        self.ahead = ahead
+        self.executor = ProcessPoolExecutor(
+            processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_setup_worker,
+        )
+
+    def map(self, render, chunks):
+        """Yield (chunk, render(chunk)) for each of ``chunks``, in order
+
+        ``render`` runs in a worker, so it must be picklable: a module-level
+        function or a functools.partial of one. Chunks are read from the
+        iterable only as workers free up.
+        """
+        chunks = iter(chunks)
+        in_flight = deque()
+
+        def submit():
+            for chunk in chunks:
+                in_flight.append((chunk, self.executor.submit(render, chunk)))
+                return
+
+        for _ in range(self.processes * (1 + self.ahead)):
+            submit()
+        try:
+            while in_flight:
+                chunk, future = in_flight.popleft()
+                result = future.result()
+                submit()
+                yield chunk, result
+        finally:
+            # The caller stopped early, drop what hasn't started
+            for _, future in in_flight:
+                future.cancel()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -133,10 +133,49 @@ else:
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
+            # Writers wait for each other instead of failing straight away
+            "OPTIONS": {"timeout": 20},
+            # A file rather than the in-memory default, which locks whole
+            # tables, so the concurrent checkout tests can run on SQLite
+            "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
         }
     }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# Catalog caches are invalidated by bumping a version key, so the backend
+# must be shared by all worker processes. The file-based cache needs no
+# extra service on cPanel; point CACHE_BACKEND at Redis/Memcached if available.
+CACHES = {
+    "default": {
+        "BACKEND": config(
+            "CACHE_BACKEND",
+            default="django.core.cache.backends.filebased.FileBasedCache",
+        ),
+        "LOCATION": config("CACHE_LOCATION", default=str(BASE_DIR / "cache")),
+        "TIMEOUT": 300,
+    }
+}
+
+
+# Cart storage: orders.carts.DatabaseCartBackend keeps every cart in the
+# database, orders.carts.SessionCartBackend keeps anonymous carts in the
+# session and merges them into the user's cart on login
+CART_BACKEND = config("CART_BACKEND", default="orders.carts.DatabaseCartBackend")
+
+# Order numbers (see orders.numbering). Give each host taking orders its own
+# shard, 0-15
+ORDER_NUMBER_GENERATOR = "orders.numbering.TimeOrderedGenerator"
+ORDER_NUMBER_SHARD = config("ORDER_NUMBER_SHARD", default=0, cast=int)
+
+# Flash-sale stock (see products.stock): counter rows per sharded product,
+# and how long product pages may show a stale total
+STOCK_SHARDS = 8
+STOCK_SHARD_CACHE_TIMEOUT = 5
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -224,6 +263,19 @@ DEFAULT_FROM_EMAIL = config(
     "DEFAULT_FROM_EMAIL", default="JigsimurHerbal <info@jigsimurherbalwonders.com>"
 )
 
+# "outbox" queues emails for the run_email_worker command, "sync" sends
+# them during the request
+EMAIL_DELIVERY = config("EMAIL_DELIVERY", default="outbox")
+
+# Open connections kept per process, and how long one may sit idle before
+# it is closed instead of reused (see jigsimurherbal.mail_pool)
+EMAIL_CONNECTION_POOL_SIZE = 2
+EMAIL_CONNECTION_MAX_IDLE = 30
+
+# Worker processes rendering newsletters and order notifications, 0 to
+# render in the sending process (see jigsimurherbal.render_pool)
+EMAIL_RENDER_PROCESSES = config("EMAIL_RENDER_PROCESSES", default=0, cast=int)
+
 # Site URL for email templates and absolute URLs
 SITE_URL = config("SITE_URL", default="http://localhost:8000")
 
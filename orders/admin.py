@@ -1,9 +1,20 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.template.response import TemplateResponse
 from django.utils.html import format_html
-from django.urls import reverse
+from django.urls import path, reverse
 from django.utils.safestring import mark_safe
 from django.db.models import Sum, Count
-from .models import Cart, CartItem, Order, OrderItem, ShippingMethod, OrderTracking
+from .models import (
+    Cart,
+    CartItem,
+    EmailOutbox,
+    Order,
+    OrderItem,
+    ShippingMethod,
+    OrderTracking,
+)
+from .notifications import notification_progress, transition_orders
+from .outbox import retry_failed
 
 
 class CartItemInline(admin.TabularInline):
@@ -266,94 +277,53 @@ class OrderAdmin(admin.ModelAdmin):
     mark_as_processing.short_description = "Mark as Processing"
 
     def mark_as_shipped(self, request, queryset):
-        from django.utils import timezone
-        from jigsimurherbal.email_utils import EmailService
-        from django.template.loader import render_to_string
-        from django.utils.html import strip_tags
-        from django.conf import settings
-
-        count = 0
-        for order in queryset:
-            order.status = "shipped"
-            order.shipped_at = timezone.now()
-            order.save()
-
-            # Send shipped notification email
-            try:
-                html_message = render_to_string(
-                    "emails/orders/order_shipped.html",
-                    {
-                        "order": order,
-                        "website_url": settings.SITE_URL,
-                    },
-                )
-                plain_message = strip_tags(html_message)
-
-                EmailService.send_order_notification(
-                    subject=f"Your Order #{order.order_number} Has Been Shipped! 📦",
-                    message=plain_message,
-                    recipient_list=[order.user.email],
-                    html_message=html_message,
-                )
-            except Exception as e:
-                import logging
-
-                logging.error(
-                    f"Failed to send shipped email for order {order.order_number}: {str(e)}"
-                )
-
-            count += 1
-
-        self.message_user(
-            request, "{} orders marked as shipped and emails sent.".format(count)
-        )
+        self._transition(request, queryset, "shipped")
 
     mark_as_shipped.short_description = "Mark as Shipped"
 
     def mark_as_delivered(self, request, queryset):
-        from django.utils import timezone
-        from jigsimurherbal.email_utils import EmailService
-        from django.template.loader import render_to_string
-        from django.utils.html import strip_tags
-        from django.conf import settings
-
-        count = 0
-        for order in queryset:
-            order.status = "delivered"
-            order.delivered_at = timezone.now()
-            order.save()
-
-            # Send delivered notification email
-            try:
-                html_message = render_to_string(
-                    "emails/orders/order_delivered.html",
-                    {
-                        "order": order,
-                        "website_url": settings.SITE_URL,
-                    },
-                )
-                plain_message = strip_tags(html_message)
-
-                EmailService.send_order_notification(
-                    subject=f"Your Order #{order.order_number} Has Been Delivered! ✅",
-                    message=plain_message,
-                    recipient_list=[order.user.email],
-                    html_message=html_message,
-                )
-            except Exception as e:
-                import logging
-
-                logging.error(
-                    f"Failed to send delivered email for order {order.order_number}: {str(e)}"
-                )
-
-            count += 1
+        self._transition(request, queryset, "delivered")
 
+    mark_as_delivered.short_description = "Mark as Delivered"
+
+    def _transition(self, request, queryset, status):
+        """Move the orders in bulk, leaving the emails to the email worker"""
+        count, batch = transition_orders(queryset, status)
+        if not count:
+            self.message_user(
+                request, f"All selected orders were already {status}.", messages.INFO
+            )
+            return
         self.message_user(
-            request, "{} orders marked as delivered and emails sent.".format(count)
+            request,
+            format_html(
+                '{} orders marked as {}. <a href="{}">Follow their email notifications</a>.',
+                count,
+                status,
+                reverse("admin:orders_notification_progress", args=[batch]),
+            ),
         )
 
-    mark_as_delivered.short_description = "Mark as Delivered"
+    def get_urls(self):
+        return [
+            path(
+                "notifications/<uuid:batch>/",
+                self.admin_site.admin_view(self.notification_progress_view),
+                name="orders_notification_progress",
+            ),
+        ] + super().get_urls()
+
+    def notification_progress_view(self, request, batch):
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Order notifications",
+            "opts": self.model._meta,
+            "batch": batch,
+            "progress": notification_progress(batch),
+        }
+        return TemplateResponse(
+            request, "admin/orders/notification_progress.html", context
+        )
 
     def mark_as_cancelled(self, request, queryset):
         queryset.update(status="cancelled")
@@ -409,3 +379,43 @@ class ShippingMethodAdmin(admin.ModelAdmin):
         return format_html('<span style="color: red;">●</span> Inactive')
 
     status_display.short_description = "Status"
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = [
+        "subject",
+        "recipient_list",
+        "status",
+        "attempts",
+        "next_attempt_at",
+        "created_at",
+        "sent_at",
+    ]
+    list_filter = ["status", "created_at"]
+    search_fields = ["subject", "recipients"]
+    date_hierarchy = "created_at"
+    readonly_fields = [
+        "from_email",
+        "recipients",
+        "subject",
+        "body",
+        "html_body",
+        "attempts",
+        "claimed_at",
+        "last_error",
+        "created_at",
+        "sent_at",
+    ]
+    actions = ["retry_emails"]
+
+    def recipient_list(self, obj):
+        return ", ".join(obj.recipients)
+
+    recipient_list.short_description = "Recipients"
+
+    def retry_emails(self, request, queryset):
+        count = retry_failed(queryset)
+        self.message_user(request, "{} failed emails queued for retry.".format(count))
+
+    retry_emails.short_description = "Retry failed emails"
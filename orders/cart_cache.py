@@ -0,0 +1,50 @@
+"""
+Cached cart item counts for the navbar badge.
+
+The count is read on every page render, so it is served from the cache and
+only falls back to the database on a miss. Looking it up never creates a
+session or a Cart row.
+"""
+
+from django.core.cache import cache
+from django.db.models import Sum
+
+CART_COUNT_TIMEOUT = 60 * 60 * 24
+
+
+def cart_count_key(user_id=None, session_key=None):
+    """Build the cache key for a cart owned by a user or a session"""
+    if user_id:
+        return f"cart_count:user:{user_id}"
+    if session_key:
+        return f"cart_count:session:{session_key}"
+    return None
+
+
+def get_cart_count(request):
+    """Return the number of items in the current visitor's cart"""
+    from .models import CartItem
+
+    if request.user.is_authenticated:
+        key = cart_count_key(user_id=request.user.id)
+        items = CartItem.objects.filter(cart__user_id=request.user.id)
+    else:
+        session_key = request.session.session_key
+        if not session_key:
+            # No session yet means no cart yet
+            return 0
+        key = cart_count_key(session_key=session_key)
+        items = CartItem.objects.filter(cart__session_key=session_key)
+
+    count = cache.get(key)
+    if count is None:
+        count = items.aggregate(total=Sum("quantity"))["total"] or 0
+        cache.set(key, count, CART_COUNT_TIMEOUT)
+    return count
+
+
+def set_cart_count(cart, count):
+    """Store the item count after a cart write"""
+    key = cart_count_key(user_id=cart.user_id, session_key=cart.session_key)
+    if key:
+        cache.set(key, count, CART_COUNT_TIMEOUT)
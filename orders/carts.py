@@ -0,0 +1,271 @@
+"""
+Cart storage backends
+
+Views get the visitor's cart from ``get_cart_backend().get_cart(request)``
+and only use the interface shared by Cart and SessionCart: lines(),
+get_line(), add(), set_quantity(), summarize_lines(), summary, total_items
+and total_price.
+add() and set_quantity() return False, leaving the cart alone, when the
+product doesn't have the stock for the new quantity.
+
+The backend is chosen with the CART_BACKEND setting:
+
+- DatabaseCartBackend: every cart is a Cart row with CartItem rows, anonymous
+  ones keyed by session.
+- SessionCartBackend: signed-in users keep their Cart row, but anonymous carts
+  live in the session as {product id: quantity}. No rows are written for
+  visitors who never check out, and abandoned carts expire with their
+  session. The session cart is merged into the user's cart on login.
+"""
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+from products.models import Product
+
+from .cart_cache import get_cart_count, set_cart_count
+from .models import Cart, CartItem, summarize_lines
+
+SESSION_CART_KEY = "cart"
+
+# Writes a cart line in one statement. The SELECT only yields a row while
+# the product is on sale with enough stock, and an existing line is only
+# updated while its new quantity still fits the stock, so the ceiling is
+# enforced by the database even when two requests write the same line.
+UPSERT_CART_LINE_SQL = """
+    INSERT INTO orders_cartitem (cart_id, product_id, quantity, created_at, updated_at)
+    SELECT %(cart_id)s, p.id, %(quantity)s, %(now)s, %(now)s
+    FROM products_product p
+    WHERE p.id = %(product_id)s AND p.is_available AND p.stock_quantity >= %(quantity)s
+    ON CONFLICT (cart_id, product_id) DO UPDATE SET
+        quantity = {new_quantity},
+        updated_at = excluded.updated_at
+    WHERE {new_quantity} <= (
+        SELECT stock_quantity FROM products_product WHERE id = excluded.product_id
+    )
+"""
+
+# MySQL has no conditional ON DUPLICATE KEY UPDATE, so each column keeps
+# its old value when the new quantity doesn't fit. updated_at is assigned
+# first because MySQL evaluates the assignments left to right.
+UPSERT_CART_LINE_MYSQL = """
+    INSERT INTO orders_cartitem (cart_id, product_id, quantity, created_at, updated_at)
+    SELECT %(cart_id)s, p.id, %(quantity)s, %(now)s, %(now)s
+    FROM products_product p
+    WHERE p.id = %(product_id)s AND p.is_available AND p.stock_quantity >= %(quantity)s
+    ON DUPLICATE KEY UPDATE
+        updated_at = IF({fits}, VALUES(updated_at), orders_cartitem.updated_at),
+        quantity = IF({fits}, {new_quantity}, orders_cartitem.quantity)
+"""
+
+
+def upsert_cart_line(cart_id, product_id, quantity, increment):
+    """Add to (or with increment=False, set) a cart line's quantity
+
+    Returns whether the line was written.
+    """
+    if connection.vendor == "mysql":
+        new_quantity = (
+            "orders_cartitem.quantity + VALUES(quantity)"
+            if increment
+            else "VALUES(quantity)"
+        )
+        fits = (
+            f"{new_quantity} <= (SELECT stock_quantity FROM products_product "
+            "WHERE id = VALUES(product_id))"
+        )
+        sql = UPSERT_CART_LINE_MYSQL.format(new_quantity=new_quantity, fits=fits)
+    else:
+        # PostgreSQL and SQLite (3.24+) share the ON CONFLICT syntax
+        new_quantity = (
+            "orders_cartitem.quantity + excluded.quantity"
+            if increment
+            else "excluded.quantity"
+        )
+        sql = UPSERT_CART_LINE_SQL.format(new_quantity=new_quantity)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql,
+            {
+                "cart_id": cart_id,
+                "product_id": product_id,
+                "quantity": quantity,
+                "now": connection.ops.adapt_datetimefield_value(timezone.now()),
+            },
+        )
+        if connection.vendor == "mysql":
+            # Django connects with CLIENT_FOUND_ROWS: 2 is an updated line, 1
+            # either a new line or one left as it was, told apart by the id
+            return cursor.rowcount == 2 or (
+                cursor.rowcount == 1 and bool(cursor.lastrowid)
+            )
+        return cursor.rowcount == 1
+
+
+class DatabaseCartBackend:
+    def get_cart(self, request):
+        """Get or create the cart row for the user or session"""
+        if request.user.is_authenticated:
+            cart, created = Cart.objects.get_or_create(user=request.user)
+        else:
+            session_key = request.session.session_key
+            if not session_key:
+                request.session.create()
+                session_key = request.session.session_key
+            cart, created = Cart.objects.get_or_create(session_key=session_key)
+        return cart
+
+    def count(self, request):
+        return get_cart_count(request)
+
+    def merge(self, request, user):
+        pass
+
+
+class SessionCartItem:
+    """A session cart line, shaped like CartItem for the templates"""
+
+    def __init__(self, product, quantity):
+        self.id = product.id
+        self.product = product
+        self.quantity = quantity
+
+    def get_total_price(self):
+        return self.quantity * self.product.price
+
+    @property
+    def total_price(self):
+        return self.get_total_price()
+
+
+class SessionCart:
+    # Counts are read from the session, not the cart count cache
+    user_id = None
+    session_key = None
+
+    def __init__(self, session):
+        self.session = session
+
+    @property
+    def contents(self):
+        return self.session.get(SESSION_CART_KEY, {})
+
+    @cached_property
+    def _lines(self):
+        contents = self.contents
+        products = Product.objects.in_bulk([int(product_id) for product_id in contents])
+        return [
+            SessionCartItem(products[int(product_id)], quantity)
+            for product_id, quantity in contents.items()
+            if int(product_id) in products and products[int(product_id)].is_available
+        ]
+
+    def lines(self):
+        return self._lines
+
+    def get_line(self, line_id):
+        return next((line for line in self._lines if line.id == line_id), None)
+
+    def add(self, product, quantity):
+        return self.set_quantity(
+            product, self.contents.get(str(product.id), 0) + quantity
+        )
+
+    def set_quantity(self, product, quantity):
+        contents = dict(self.contents)
+        if quantity <= 0:
+            contents.pop(str(product.id), None)
+        elif product.is_available and quantity <= product.stock_quantity:
+            contents[str(product.id)] = quantity
+        else:
+            return False
+        self.session[SESSION_CART_KEY] = contents
+        self.refresh_summary()
+        return True
+
+    @cached_property
+    def summary(self):
+        return summarize_lines(self._lines)
+
+    def refresh_summary(self):
+        self.__dict__.pop("_lines", None)
+        self.__dict__.pop("summary", None)
+
+    def summarize_lines(self, lines):
+        # The summary is always worked out from the loaded lines
+        pass
+
+    @property
+    def total_items(self):
+        return self.summary["total_items"]
+
+    @property
+    def total_price(self):
+        return self.summary["total_price"]
+
+
+class SessionCartBackend(DatabaseCartBackend):
+    def get_cart(self, request):
+        if request.user.is_authenticated:
+            return super().get_cart(request)
+        return SessionCart(request.session)
+
+    def count(self, request):
+        if request.user.is_authenticated:
+            return super().count(request)
+        if not request.session.session_key:
+            return 0
+        return sum(request.session.get(SESSION_CART_KEY, {}).values())
+
+    def merge(self, request, user):
+        """Add the session cart to the user's cart with one bulk upsert"""
+        contents = request.session.pop(SESSION_CART_KEY, None)
+        if not contents:
+            return
+
+        cart, created = Cart.objects.get_or_create(user=user)
+        quantities = {int(product_id): qty for product_id, qty in contents.items()}
+        products = Product.objects.filter(is_available=True).in_bulk(list(quantities))
+        existing = dict(
+            cart.items.filter(product_id__in=list(products)).values_list(
+                "product_id", "quantity"
+            )
+        )
+
+        items = []
+        for product_id, product in products.items():
+            # Never merge more than is in stock
+            quantity = min(
+                existing.get(product_id, 0) + quantities[product_id],
+                product.stock_quantity,
+            )
+            if quantity > 0:
+                items.append(
+                    CartItem(cart=cart, product_id=product_id, quantity=quantity)
+                )
+        # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target, Django
+        # refuses unique_fields there
+        unique_fields = None if connection.vendor == "mysql" else ["cart", "product"]
+        CartItem.objects.bulk_create(
+            items,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=["quantity", "updated_at"],
+        )
+        set_cart_count(cart, cart.total_items)
+
+
+_backend = None
+
+
+def get_cart_backend():
+    """Return the configured cart backend"""
+    global _backend
+    if _backend is None:
+        _backend = import_string(
+            getattr(settings, "CART_BACKEND", "orders.carts.DatabaseCartBackend")
+        )()
+    return _backend
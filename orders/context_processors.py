@@ -1,6 +1,14 @@
+from django.utils.functional import SimpleLazyObject
+
+
 def cart_items_count(request):
-    """Context processor for cart items count"""
-    from .views import get_or_create_cart
+    """Context processor for cart items count
+
+    The value is lazy so pages that never show the cart badge don't touch
+    the cache or the database at all.
+    """
+    from .carts import get_cart_backend
 
-    cart = get_or_create_cart(request)
-    return {"cart_items_count": cart.total_items}
+    return {
+        "cart_items_count": SimpleLazyObject(lambda: get_cart_backend().count(request))
+    }
@@ -73,8 +73,22 @@ class CheckoutForm(forms.ModelForm):
             "notes": forms.Textarea(attrs={"class": "form-control", "rows": 3}),
         }
 
+    ADDRESS_FIELDS = [
+        "first_name",
+        "last_name",
+        "company",
+        "address_line_1",
+        "address_line_2",
+        "city",
+        "state",
+        "postal_code",
+        "country",
+    ]
+
     def __init__(self, *args, **kwargs):
         user = kwargs.pop("user", None)
+        # The user's saved addresses, when the view has already loaded them
+        addresses = kwargs.pop("addresses", None)
         super().__init__(*args, **kwargs)
 
         if user:
@@ -84,47 +98,16 @@ class CheckoutForm(forms.ModelForm):
             self.fields["shipping_first_name"].initial = user.first_name
             self.fields["shipping_last_name"].initial = user.last_name
 
-            # Get default addresses
-            try:
-                billing_address = Address.objects.get(
-                    user=user, type="billing", is_default=True
-                )
-                self.fields["billing_first_name"].initial = billing_address.first_name
-                self.fields["billing_last_name"].initial = billing_address.last_name
-                self.fields["billing_company"].initial = billing_address.company
-                self.fields["billing_address_line_1"].initial = (
-                    billing_address.address_line_1
-                )
-                self.fields["billing_address_line_2"].initial = (
-                    billing_address.address_line_2
-                )
-                self.fields["billing_city"].initial = billing_address.city
-                self.fields["billing_state"].initial = billing_address.state
-                self.fields["billing_postal_code"].initial = billing_address.postal_code
-                self.fields["billing_country"].initial = billing_address.country
-                self.fields["billing_phone"].initial = billing_address.phone_number
-            except Address.DoesNotExist:
-                pass
-
-            try:
-                shipping_address = Address.objects.get(
-                    user=user, type="shipping", is_default=True
-                )
-                self.fields["shipping_first_name"].initial = shipping_address.first_name
-                self.fields["shipping_last_name"].initial = shipping_address.last_name
-                self.fields["shipping_company"].initial = shipping_address.company
-                self.fields["shipping_address_line_1"].initial = (
-                    shipping_address.address_line_1
-                )
-                self.fields["shipping_address_line_2"].initial = (
-                    shipping_address.address_line_2
-                )
-                self.fields["shipping_city"].initial = shipping_address.city
-                self.fields["shipping_state"].initial = shipping_address.state
-                self.fields["shipping_postal_code"].initial = (
-                    shipping_address.postal_code
-                )
-                self.fields["shipping_country"].initial = shipping_address.country
-                self.fields["shipping_phone"].initial = shipping_address.phone_number
-            except Address.DoesNotExist:
-                pass
+            # Fill in the default addresses, read in one query
+            if addresses is None:
+                addresses = Address.objects.filter(user=user)
+            defaults = {
+                address.type: address for address in addresses if address.is_default
+            }
+            for kind in ("billing", "shipping"):
+                address = defaults.get(kind)
+                if address is None:
+                    continue
+                for field in self.ADDRESS_FIELDS:
+                    self.fields[f"{kind}_{field}"].initial = getattr(address, field)
+                self.fields[f"{kind}_phone"].initial = address.phone_number
@@ -0,0 +1,158 @@
+import socketserver
+import threading
+import time
+
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.management.base import BaseCommand, CommandError
+from jigsimurherbal.mail_pool import ConnectionPool
+
+
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept messages and count them"""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        # Stands in for the TLS handshake and login of a real server
+        time.sleep(server.connect_latency)
+        self.reply("220 stand-in ESMTP")
+        in_data = False
+        received = 0
+        for line in self.rfile:
+            if in_data:
+                if line == b".\r\n":
+                    in_data = False
+                    received += 1
+                    with server.lock:
+                        server.received += 1
+                    self.reply("250 OK")
+                    if server.drop_every and received % server.drop_every == 0:
+                        return  # Hang up, like a server recycling connections
+                continue
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                self.reply("250 stand-in")
+            elif command == b"DATA":
+                in_data = True
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+            elif command == b"QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class StandInSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, connect_latency, drop_every):
+        super().__init__(("127.0.0.1", 0), StandInSMTPHandler)
+        self.connect_latency = connect_latency
+        self.drop_every = drop_every
+        self.lock = threading.Lock()
+        self.received = 0
+
+
+class Command(BaseCommand):
+    help = "Compare a connection per email with pooled, batched sends on a local SMTP stand-in"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=200)
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.05,
+            help="Seconds the stand-in takes to accept a connection",
+        )
+        parser.add_argument(
+            "--drop-every",
+            type=int,
+            default=0,
+            help="Have the stand-in hang up after this many messages per connection",
+        )
+
+    def handle(self, *args, **options):
+        server = StandInSMTPServer(options["latency"], options["drop_every"])
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.connection_kwargs = {
+            "backend": "django.core.mail.backends.smtp.EmailBackend",
+            "host": "127.0.0.1",
+            "port": server.server_address[1],
+            "username": "",
+            "password": "",
+            "use_tls": False,
+            "use_ssl": False,
+            "timeout": 10,
+        }
+        total = options["messages"]
+        try:
+            before = self.run("connection per email", self.send_singly, total, server)
+            after = self.run(
+                "pooled batches",
+                lambda messages: self.send_pooled(messages, options["batch_size"]),
+                total,
+                server,
+            )
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.stdout.write(self.style.SUCCESS(f"Speed-up: {after / before:.1f}x"))
+
+    def build_messages(self, total):
+        messages = []
+        for i in range(total):
+            message = EmailMultiAlternatives(
+                subject=f"Benchmark message {i}",
+                body="Your order has been shipped.",
+                from_email="shop@example.com",
+                to=[f"customer{i}@example.com"],
+            )
+            message.attach_alternative(
+                "<p>Your order has been shipped.</p>", "text/html"
+            )
+            messages.append(message)
+        return messages
+
+    def run(self, label, send, total, server):
+        messages = self.build_messages(total)
+        received_before = server.received
+        started = time.monotonic()
+        failed = send(messages)
+        elapsed = time.monotonic() - started
+        received = server.received - received_before
+        rate = total / elapsed
+        self.stdout.write(
+            f"{label:<22} {rate:>8,.1f} msg/s  {elapsed:6.2f}s  "
+            f"{received} received, {failed} failed"
+        )
+        if received + failed != total:
+            raise CommandError(f"{label}: {received} of {total} messages arrived")
+        return rate
+
+    def send_singly(self, messages):
+        # What send_mail does: open, log in, send one message, close
+        failed = 0
+        for message in messages:
+            message.connection = get_connection(
+                fail_silently=False, **self.connection_kwargs
+            )
+            try:
+                message.send()
+            except Exception:
+                failed += 1
+        return failed
+
+    def send_pooled(self, messages, batch_size):
+        pool = ConnectionPool(**self.connection_kwargs)
+        failed = 0
+        try:
+            for start in range(0, len(messages), batch_size):
+                results = pool.send_messages(messages[start : start + batch_size])
+                failed += sum(1 for error in results if error)
+        finally:
+            pool.close()
+        return failed
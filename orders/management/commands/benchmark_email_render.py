@@ -0,0 +1,95 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.html import strip_tags
+from jigsimurherbal.email_render import render_email
+from orders.models import Order, OrderItem
+from products.models import Product
+
+TEMPLATES = [
+    "emails/orders/order_confirmation.html",
+    "emails/orders/order_shipped.html",
+]
+
+
+class Command(BaseCommand):
+    help = "Compare render_to_string + strip_tags with the inlining email renderer"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=10000)
+        parser.add_argument("--items", type=int, default=3, help="Lines per order")
+
+    def handle(self, *args, **options):
+        context = {
+            "order": self.build_order(options["items"]),
+            "website_url": "https://example.com",
+        }
+        iterations = options["iterations"]
+        for template_name in TEMPLATES:
+            self.stdout.write(template_name)
+            before = self.run(
+                "render_to_string",
+                lambda: self.render_plainly(template_name, context),
+                iterations,
+            )
+            after = self.run(
+                "render_email",
+                lambda: render_email(template_name, context),
+                iterations,
+            )
+            self.stdout.write(self.style.SUCCESS(f"  Speed-up: {after / before:.1f}x"))
+
+    def build_order(self, items):
+        # Unsaved, with its items prefetched, so no queries are timed
+        now = timezone.now()
+        order = Order(
+            pk=1,
+            order_number="JH-BENCHMARK",
+            subtotal=Decimal("7500"),
+            shipping_cost=Decimal("1500"),
+            tax_amount=Decimal("0"),
+            total_amount=Decimal("9000"),
+            billing_first_name="Ada",
+            billing_last_name="Obi",
+            shipping_first_name="Ada",
+            shipping_last_name="Obi",
+            shipping_address_line_1="12 Allen Avenue",
+            shipping_city="Ikeja",
+            shipping_state="Lagos",
+            shipping_postal_code="100271",
+            shipping_country="Nigeria",
+            payment_method="bank_transfer",
+            created_at=now,
+            shipped_at=now,
+        )
+        order._prefetched_objects_cache = {
+            "items": [
+                OrderItem(
+                    product=Product(name=f"Herbal product {i}"),
+                    product_price=Decimal("2500"),
+                    quantity=1,
+                )
+                for i in range(items)
+            ]
+        }
+        return order
+
+    def render_plainly(self, template_name, context):
+        html = render_to_string(template_name, context)
+        return html, strip_tags(html)
+
+    def run(self, label, render, iterations):
+        html, text = render()  # Warm the template caches
+        started = time.perf_counter()
+        for _ in range(iterations):
+            render()
+        elapsed = time.perf_counter() - started
+        rate = iterations / elapsed
+        self.stdout.write(
+            f"  {label:<18} {rate:>8,.0f} emails/s  {elapsed:6.2f}s  "
+            f"html {len(html):,} bytes, text {len(text):,} bytes"
+        )
+        return rate
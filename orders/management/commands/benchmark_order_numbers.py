@@ -0,0 +1,74 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from orders.numbering import get_order_number_generator, is_valid_order_number
+
+
+def _setup_worker():
+    # Needed when workers are spawned rather than forked
+    django.setup()
+
+
+def _generate(count):
+    generator = get_order_number_generator()
+    started = time.perf_counter()
+    numbers = [generator.next() for _ in range(count)]
+    return numbers, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = "Generate order numbers in parallel processes and check for duplicates"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--count", type=int, default=1_000_000, help="Numbers in total"
+        )
+        parser.add_argument("--processes", type=int, default=4)
+        parser.add_argument(
+            "--batches",
+            type=int,
+            default=None,
+            help="Work units handed to the pool (defaults to 4 per process)",
+        )
+
+    def handle(self, *args, **options):
+        processes = options["processes"]
+        batches = options["batches"] or processes * 4
+        per_batch, extra = divmod(options["count"], batches)
+        sizes = [per_batch + (1 if i < extra else 0) for i in range(batches)]
+
+        self.stdout.write(
+            f"Generating {options['count']:,} order numbers in {processes} processes..."
+        )
+        seen = set()
+        duplicates = invalid = 0
+        busy = 0.0
+        started = time.perf_counter()
+        with ProcessPoolExecutor(
+            max_workers=processes, initializer=_setup_worker
+        ) as executor:
+            for numbers, elapsed in executor.map(_generate, sizes):
+                busy += elapsed
+                for number in numbers:
+                    if number in seen:
+                        duplicates += 1
+                    seen.add(number)
+                invalid += sum(
+                    not is_valid_order_number(number) for number in numbers[:1000]
+                )
+        wall = time.perf_counter() - started
+
+        count = sum(sizes)
+        self.stdout.write(
+            f"{count:,} numbers in {wall:.2f}s wall clock, "
+            f"{count / busy:,.0f} per second per process"
+        )
+        self.stdout.write(f"Sample: {', '.join(sorted(seen)[:3])}")
+        self.stdout.write(f"Unique: {len(seen):,}, duplicates: {duplicates}")
+        if duplicates or invalid:
+            raise CommandError(
+                f"{duplicates} duplicate and {invalid} invalid order numbers."
+            )
+        self.stdout.write(self.style.SUCCESS("No duplicates."))
@@ -0,0 +1,107 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from orders.models import Cart, CartItem
+
+DB_SESSION_ENGINES = {
+    "django.contrib.sessions.backends.db",
+    "django.contrib.sessions.backends.cached_db",
+}
+
+
+class Command(BaseCommand):
+    help = "Delete abandoned anonymous carts and expired sessions in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.SESSION_COOKIE_AGE // (24 * 60 * 60),
+            help="Prune anonymous carts untouched for this many days "
+            "(default: the session cookie age)",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.1,
+            help="Seconds to pause between batches so other writers get a turn",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Only count what would be deleted"
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = options["batch_size"]
+        self.pause = options["sleep"]
+        cutoff = timezone.now() - timedelta(days=options["days"])
+
+        # Adding to a cart writes its items, not the cart row, so a cart is
+        # only stale when neither has been touched since the cutoff
+        stale_carts = Cart.objects.filter(
+            user__isnull=True, updated_at__lt=cutoff
+        ).exclude(
+            Exists(CartItem.objects.filter(cart=OuterRef("pk"), updated_at__gte=cutoff))
+        )
+        expired_sessions = Session.objects.filter(expire_date__lt=timezone.now())
+        prune_sessions = settings.SESSION_ENGINE in DB_SESSION_ENGINES
+
+        if options["dry_run"]:
+            self.stdout.write(
+                f"{stale_carts.count()} carts with "
+                f"{CartItem.objects.filter(cart__in=stale_carts).count()} items "
+                f"older than {options['days']} days"
+            )
+            if prune_sessions:
+                self.stdout.write(f"{expired_sessions.count()} expired sessions")
+            return
+
+        self.prune("carts", stale_carts, "id")
+        if prune_sessions:
+            self.prune("sessions", expired_sessions, "session_key")
+        else:
+            self.stdout.write(
+                f"Sessions are stored by {settings.SESSION_ENGINE}, not pruned"
+            )
+
+    def prune(self, label, queryset, key):
+        """Delete ``queryset`` in batches, walking ``key`` in ascending order
+
+        Each batch starts after the last key of the previous one, so the
+        database never rescans rows that were kept, and every batch is its
+        own short transaction.
+        """
+        deleted = batches = 0
+        last_key = None
+        started = time.monotonic()
+        while True:
+            page = queryset.order_by(key)
+            if last_key is not None:
+                page = page.filter(**{f"{key}__gt": last_key})
+            keys = list(page.values_list(key, flat=True)[: self.batch_size])
+            if not keys:
+                break
+            last_key = keys[-1]
+
+            with transaction.atomic():
+                # Filter again, in case a visitor came back since the read
+                count, _ = queryset.filter(**{f"{key}__in": keys}).delete()
+            deleted += count
+            batches += 1
+            if self.pause:
+                time.sleep(self.pause)
+
+        elapsed = time.monotonic() - started
+        rate = deleted / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Pruned {label}: {deleted} rows in {batches} batches, "
+                f"{elapsed:.1f}s ({rate:,.0f} rows/s)"
+            )
+        )
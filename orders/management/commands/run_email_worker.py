@@ -0,0 +1,95 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from jigsimurherbal.render_pool import RENDER_PROCESSES, RenderPool
+from orders.notifications import iter_render_notifications, render_notifications
+from orders.outbox import claim_batch, deliver_batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Render queued order notifications and deliver the email outbox, "
+        "retrying failures with backoff"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit when nothing is due instead of polling",
+        )
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds to wait between polls when the outbox is empty",
+        )
+        parser.add_argument(
+            "--render-processes",
+            type=int,
+            default=RENDER_PROCESSES,
+            help="Worker processes rendering order notifications (default: "
+            "EMAIL_RENDER_PROCESSES, 0 renders in this process)",
+        )
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        render_pool = None
+        if options["render_processes"]:
+            render_pool = RenderPool(options["render_processes"])
+
+        self.total_sent = self.total_failed = 0
+        try:
+            while self.running:
+                if render_pool:
+                    rendered = self.render_and_deliver(
+                        options["batch_size"], render_pool
+                    )
+                else:
+                    rendered = len(render_notifications(options["batch_size"]))
+                    if rendered:
+                        self.stdout.write(f"Rendered {rendered} order notifications")
+                emails = claim_batch(options["batch_size"])
+                if not emails and not rendered:
+                    if options["once"]:
+                        break
+                    time.sleep(options["interval"])
+                    continue
+                if emails:
+                    self.deliver(emails)
+        finally:
+            if render_pool:
+                render_pool.close()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Email worker stopped: {self.total_sent} sent, "
+                f"{self.total_failed} failed."
+            )
+        )
+
+    def deliver(self, emails):
+        sent, failed = deliver_batch(emails)
+        self.total_sent += sent
+        self.total_failed += failed
+        self.stdout.write(f"Sent {sent} emails, {failed} failed")
+
+    def render_and_deliver(self, batch_size, render_pool):
+        # A batch per worker, each delivered while the next ones render
+        rendered = 0
+        for emails in iter_render_notifications(
+            batch_size * render_pool.processes, render_pool=render_pool, claim=True
+        ):
+            rendered += len(emails)
+            self.stdout.write(f"Rendered {len(emails)} order notifications")
+            self.deliver(emails)
+        return rendered
+
+    def stop(self, signum, frame):
+        # Finish the current batch, then exit
+        self.running = False
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="cart",
+            name="session_key",
+            field=models.CharField(blank=True, db_index=True, max_length=40, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["user", "-created_at"], name="order_user_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ordertracking",
+            index=models.Index(
+                fields=["order", "-created_at"], name="tracking_order_created_idx"
+            ),
+        ),
+    ]
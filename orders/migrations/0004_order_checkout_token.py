@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0003_email_outbox"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="checkout_token",
+            field=models.CharField(
+                blank=True, editable=False, max_length=64, null=True, unique=True
+            ),
+        ),
+    ]
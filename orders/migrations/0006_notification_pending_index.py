@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0005_order_notification"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="ordernotification",
+            name="notification_pending_idx",
+        ),
+        migrations.AlterField(
+            model_name="ordernotification",
+            name="batch",
+            field=models.UUIDField(),
+        ),
+        migrations.AddIndex(
+            model_name="ordernotification",
+            index=models.Index(
+                fields=["batch", "email", "id"], name="notification_pending_idx"
+            ),
+        ),
+    ]
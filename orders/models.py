@@ -1,12 +1,28 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.functional import cached_property
 from products.models import Product
 import uuid
 
 
+def summarize_lines(lines):
+    """The same totals as Cart.summary, added up from loaded cart lines"""
+    return {
+        "line_count": len(lines),
+        "total_items": sum(line.quantity for line in lines),
+        "total_price": sum(
+            (line.get_total_price() for line in lines), Decimal("0.00")
+        ).quantize(Decimal("0.01")),
+    }
+
+
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True)
-    session_key = models.CharField(max_length=40, null=True, blank=True)
+    session_key = models.CharField(max_length=40, null=True, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -15,16 +31,79 @@ class Cart(models.Model):
             return f"Cart for {self.user.username}"
         return f"Anonymous Cart ({self.session_key})"
 
+    @cached_property
+    def summary(self):
+        """Line count, item quantity and subtotal, computed in one query
+
+        The result is kept on the instance, so views that change the cart's
+        items after reading it should call refresh_summary().
+        """
+        summary = self.items.aggregate(
+            line_count=models.Count("id"),
+            total_items=Coalesce(models.Sum("quantity"), 0),
+            total_price=Coalesce(
+                models.Sum(
+                    models.F("quantity") * models.F("product__price"),
+                    output_field=models.DecimalField(max_digits=12, decimal_places=2),
+                ),
+                Decimal("0.00"),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+        # SQLite doesn't keep the decimal scale through the multiplication
+        summary["total_price"] = summary["total_price"].quantize(Decimal("0.01"))
+        return summary
+
+    def refresh_summary(self):
+        self.__dict__.pop("summary", None)
+
+    def summarize_lines(self, lines):
+        """Fill in the summary from lines already loaded, saving its query"""
+        self.__dict__["summary"] = summarize_lines(lines)
+
+    # The methods below are the cart interface shared with
+    # orders.carts.SessionCart, so views work with either storage
+
+    def lines(self):
+        return self.items.select_related("product")
+
+    def get_line(self, line_id):
+        return self.lines().filter(id=line_id).first()
+
+    def _upsert(self, product, quantity, increment):
+        from .carts import upsert_cart_line
+
+        written = upsert_cart_line(self.pk, product.pk, quantity, increment)
+        self.refresh_summary()
+        return written
+
+    def add(self, product, quantity):
+        """Add ``quantity`` of a product, returning False if stock runs short
+
+        The line is written with a single upsert that only goes through
+        while the new quantity fits the product's stock, so concurrent adds
+        neither collide on the (cart, product) constraint nor overfill.
+        """
+        return self._upsert(product, quantity, increment=True)
+
+    def set_quantity(self, product, quantity):
+        """Set a product's quantity, returning False if stock runs short
+
+        The line is removed when the quantity drops to 0.
+        """
+        if quantity <= 0:
+            self.items.filter(product=product).delete()
+            self.refresh_summary()
+            return True
+        return self._upsert(product, quantity, increment=False)
+
     @property
     def total_items(self):
-        return self.items.aggregate(total=models.Sum("quantity"))["total"] or 0
+        return self.summary["total_items"]
 
     @property
     def total_price(self):
-        total = 0
-        for item in self.items.all():
-            total += item.get_total_price()
-        return total
+        return self.summary["total_price"]
 
 
 class CartItem(models.Model):
@@ -117,8 +196,17 @@ class Order(models.Model):
     # Notes
     notes = models.TextField(blank=True)
 
+    # Issued with the checkout form; unique so a resubmitted form can't
+    # create a second order
+    checkout_token = models.CharField(
+        max_length=64, unique=True, null=True, blank=True, editable=False
+    )
+
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["user", "-created_at"], name="order_user_created_idx"),
+        ]
 
     def __str__(self):
         return f"Order {self.order_number}"
@@ -126,12 +214,9 @@ class Order(models.Model):
     def save(self, *args, **kwargs):
         if not self.order_number:
             # Generate order number
-            import random
-            import string
+            from .numbering import next_order_number
 
-            self.order_number = "".join(
-                random.choices(string.ascii_uppercase + string.digits, k=8)
-            )
+            self.order_number = next_order_number()
         super().save(*args, **kwargs)
 
     @property
@@ -191,6 +276,85 @@ class OrderTracking(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(
+                fields=["order", "-created_at"], name="tracking_order_created_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.order.order_number} - {self.status}"
+
+
+class EmailOutbox(models.Model):
+    """An email waiting to be delivered by the run_email_worker command"""
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sending", "Sending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+
+    from_email = models.CharField(max_length=254)
+    recipients = models.JSONField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "Email outbox"
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(
+                fields=["status", "next_attempt_at"], name="outbox_status_next_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"
+
+
+class OrderNotification(models.Model):
+    """A status email for an order, rendered into the outbox by the worker
+
+    Bulk admin actions create these instead of rendering emails during the
+    request; ``batch`` groups the notifications of one action for the
+    progress page.
+    """
+
+    KIND_CHOICES = [
+        ("shipped", "Shipped"),
+        ("delivered", "Delivered"),
+    ]
+
+    batch = models.UUIDField()
+    order = models.ForeignKey(
+        Order, on_delete=models.CASCADE, related_name="notifications"
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    email = models.OneToOneField(
+        EmailOutbox, on_delete=models.SET_NULL, null=True, blank=True
+    )
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # A batch's notifications still to be rendered (email IS NULL),
+            # in id order. Not partial, MySQL doesn't have those. Across
+            # batches the unique index on email serves the same query
+            models.Index(
+                fields=["batch", "email", "id"], name="notification_pending_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} email for {self.order}"
@@ -0,0 +1,229 @@
+"""
+Bulk order status changes and their notifications
+
+The shipped and delivered admin actions move every selected order with one
+UPDATE, add the OrderTracking rows with one bulk insert, and record an
+OrderNotification per order, all in one transaction. Nothing is rendered
+or sent during the admin request. run_email_worker renders pending
+notifications into the email outbox and delivers them with everything
+else, and notification_progress() reports how far a batch has got.
+
+Rendering can be spread over a RenderPool (see jigsimurherbal.render_pool),
+in which case the worker delivers each chunk as soon as it is rendered.
+"""
+
+import logging
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from jigsimurherbal.email_render import get_email_template, html_to_text
+
+from .models import EmailOutbox, Order, OrderNotification, OrderTracking
+from .outbox import deliver_batch
+
+logger = logging.getLogger(__name__)
+
+TRANSITIONS = {
+    # status: (timestamp field, tracking description, email template, subject)
+    "shipped": (
+        "shipped_at",
+        "Your order has been shipped.",
+        "emails/orders/order_shipped.html",
+        "Your Order #{order_number} Has Been Shipped! 📦",
+    ),
+    "delivered": (
+        "delivered_at",
+        "Your order has been delivered.",
+        "emails/orders/order_delivered.html",
+        "Your Order #{order_number} Has Been Delivered! ✅",
+    ),
+}
+
+RENDER_BATCH_SIZE = 100
+
+
+def transition_orders(queryset, status):
+    """Move the orders in ``queryset`` to ``status`` and queue their emails
+
+    Orders already in that status are left alone. Returns (number of
+    orders changed, notification batch id).
+    """
+    timestamp_field, description, _, _ = TRANSITIONS[status]
+    batch = uuid.uuid4()
+    now = timezone.now()
+    with transaction.atomic():
+        order_ids = list(
+            queryset.exclude(status=status)
+            .select_for_update()
+            .values_list("id", flat=True)
+        )
+        Order.objects.filter(id__in=order_ids).update(
+            status=status, updated_at=now, **{timestamp_field: now}
+        )
+        OrderTracking.objects.bulk_create(
+            [
+                OrderTracking(order_id=order_id, status=status, description=description)
+                for order_id in order_ids
+            ]
+        )
+        OrderNotification.objects.bulk_create(
+            [
+                OrderNotification(batch=batch, order_id=order_id, kind=status)
+                for order_id in order_ids
+            ]
+        )
+        if getattr(settings, "EMAIL_DELIVERY", "outbox") == "sync":
+            # No worker runs in synchronous mode, send once committed
+            transaction.on_commit(lambda: send_batch_now(batch))
+    return len(order_ids), batch
+
+
+def _with_orders(notifications):
+    return notifications.select_related("order__user").prefetch_related("order__items")
+
+
+def _render(notifications):
+    """Render notifications, as (id, recipient, subject, html, text, error)"""
+    website_url = settings.SITE_URL
+    rendered = []
+    for notification in notifications:
+        order = notification.order
+        _, _, template_name, subject = TRANSITIONS[notification.kind]
+        try:
+            html_message = get_email_template(template_name).render(
+                {"order": order, "website_url": website_url}
+            )
+        except Exception as e:
+            logger.error(
+                "Failed to render %s email for order %s: %s",
+                notification.kind,
+                order.order_number,
+                e,
+            )
+            rendered.append((notification.id, None, None, None, None, str(e)))
+            continue
+        rendered.append(
+            (
+                notification.id,
+                order.user.email,
+                subject.format(order_number=order.order_number),
+                html_message,
+                html_to_text(html_message),
+                None,
+            )
+        )
+    return rendered
+
+
+def render_chunk(notification_ids):
+    """Render notifications in a RenderPool worker"""
+    return _render(
+        _with_orders(
+            OrderNotification.objects.filter(id__in=notification_ids)
+        ).order_by("id")
+    )
+
+
+def iter_render_notifications(limit, batch=None, render_pool=None, claim=False):
+    """Render up to ``limit`` pending notifications into the outbox
+
+    Yields the outbox emails created, a chunk at a time. With a RenderPool
+    the chunks are rendered by its workers, each while the caller handles
+    the chunk before. With ``claim`` the emails are created already
+    claimed for sending, for a caller that delivers them itself.
+
+    Several workers can run this at once: a notification is only linked
+    to the first email rendered for it.
+    """
+    pending = OrderNotification.objects.filter(email__isnull=True, error="")
+    if batch is not None:
+        pending = pending.filter(batch=batch)
+
+    if render_pool is None:
+        chunks = [_render(_with_orders(pending).order_by("id")[:limit])]
+    else:
+        ids = list(pending.order_by("id").values_list("id", flat=True)[:limit])
+        size = -(-len(ids) // render_pool.processes) or 1
+        chunks = (
+            rendered
+            for _, rendered in render_pool.map(
+                render_chunk, [ids[i : i + size] for i in range(0, len(ids), size)]
+            )
+        )
+
+    for rendered in chunks:
+        emails = []
+        for notification_id, recipient, subject, html, text, error in rendered:
+            if error is not None:
+                OrderNotification.objects.filter(id=notification_id).update(
+                    error=error[:2000]
+                )
+                continue
+            with transaction.atomic():
+                email = EmailOutbox.objects.create(
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    recipients=[recipient],
+                    subject=subject,
+                    body=text,
+                    html_body=html,
+                    status="sending" if claim else "pending",
+                    claimed_at=timezone.now() if claim else None,
+                )
+                claimed = OrderNotification.objects.filter(
+                    id=notification_id, email__isnull=True
+                ).update(email=email)
+                if not claimed:
+                    # Another worker rendered it first
+                    email.delete()
+                    continue
+            emails.append(email)
+        if emails:
+            yield emails
+
+
+def render_notifications(limit=RENDER_BATCH_SIZE, batch=None, render_pool=None):
+    """Render up to ``limit`` pending notifications, returning the emails"""
+    return [
+        email
+        for emails in iter_render_notifications(limit, batch, render_pool)
+        for email in emails
+    ]
+
+
+def send_batch_now(batch):
+    """Render and deliver a whole batch during the request (sync mode)"""
+    # A chunk whose emails all failed to render yields nothing, but those
+    # notifications get an error and leave the pending set, so keep going
+    pending = OrderNotification.objects.filter(
+        batch=batch, email__isnull=True, error=""
+    )
+    while pending.exists():
+        emails = [
+            email
+            for emails in iter_render_notifications(
+                RENDER_BATCH_SIZE, batch, claim=True
+            )
+            for email in emails
+        ]
+        if emails:
+            deliver_batch(emails)
+
+
+def notification_progress(batch):
+    """Counts of a batch's notifications by how far they have got"""
+    counts = OrderNotification.objects.filter(batch=batch).aggregate(
+        total=Count("id"),
+        waiting=Count("id", filter=Q(email__isnull=True, error="")),
+        render_failed=Count("id", filter=~Q(error="")),
+        queued=Count("id", filter=Q(email__status__in=["pending", "sending"])),
+        sent=Count("id", filter=Q(email__status="sent")),
+        send_failed=Count("id", filter=Q(email__status="failed")),
+    )
+    counts["done"] = counts["total"] and (
+        counts["sent"] + counts["render_failed"] + counts["send_failed"]
+        == counts["total"]
+    )
+    return counts
@@ -0,0 +1,124 @@
+"""
+Order number generation
+
+The generator is chosen with the ORDER_NUMBER_GENERATOR setting and is
+called by Order.save() for new orders.
+
+TimeOrderedGenerator (the default) makes numbers without touching the
+database, so it takes no locks and never retries. Each number packs:
+
+- centiseconds since 2024-01-01 (38 bits), so numbers sort by time
+- ORDER_NUMBER_SHARD (4 bits), set per host when several hosts take orders
+- the process id (22 bits), unique among the processes alive on a host
+- a per-process sequence (6 bits) for orders in the same centisecond
+
+No two live processes on a host share a pid, and each process never
+repeats a (time, sequence) pair, so numbers can't collide. They are
+written in Crockford base32 with a Luhn mod 32 check character, which
+catches single-character typos and most transpositions when customers
+read a number back: 15 characters, e.g. "10TNW4X801JQW0A". A process can
+hand out 6,400 numbers a second, which is far beyond checkout throughput.
+"""
+
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+EPOCH = 1704067200  # 2024-01-01T00:00:00Z
+TIME_BITS = 38
+SHARD_BITS = 4
+PID_BITS = 22
+SEQUENCE_BITS = 6
+
+CODE_LENGTH = 14  # Before the check character
+
+
+def encode(number, length):
+    chars = []
+    for _ in range(length):
+        number, digit = divmod(number, 32)
+        chars.append(ALPHABET[digit])
+    return "".join(reversed(chars))
+
+
+def check_character(code):
+    """Luhn mod 32 check character for a base32 code"""
+    factor = 2
+    total = 0
+    for char in reversed(code):
+        addend = factor * ALPHABET.index(char)
+        total += addend // 32 + addend % 32
+        factor = 1 if factor == 2 else 2
+    return ALPHABET[(32 - total % 32) % 32]
+
+
+def is_valid_order_number(number):
+    number = number.upper()
+    return (
+        len(number) > 1
+        and all(char in ALPHABET for char in number)
+        and check_character(number[:-1]) == number[-1]
+    )
+
+
+class TimeOrderedGenerator:
+    def __init__(self, shard=None):
+        if shard is None:
+            shard = getattr(settings, "ORDER_NUMBER_SHARD", 0)
+        if not 0 <= shard < 2**SHARD_BITS:
+            raise ValueError(f"ORDER_NUMBER_SHARD must be below {2 ** SHARD_BITS}")
+        self.shard = shard
+        self.lock = threading.Lock()
+        self.last_tick = 0
+        self.sequence = 0
+
+    def _tick(self):
+        return int((time.time() - EPOCH) * 100)
+
+    def next(self):
+        with self.lock:
+            tick = max(self._tick(), self.last_tick)  # Never go back in time
+            if tick == self.last_tick:
+                self.sequence += 1
+                if self.sequence >= 2**SEQUENCE_BITS:
+                    # Sequence used up for this tick, wait for the next one
+                    while tick <= self.last_tick:
+                        time.sleep(0.001)
+                        tick = self._tick()
+                    self.sequence = 0
+            else:
+                self.sequence = 0
+            self.last_tick = tick
+            sequence = self.sequence
+
+        number = tick % 2**TIME_BITS
+        number = (number << SHARD_BITS) | self.shard
+        number = (number << PID_BITS) | (os.getpid() % 2**PID_BITS)
+        number = (number << SEQUENCE_BITS) | sequence
+        code = encode(number, CODE_LENGTH)
+        return code + check_character(code)
+
+
+_generator = None
+
+
+def get_order_number_generator():
+    global _generator
+    if _generator is None:
+        _generator = import_string(
+            getattr(
+                settings,
+                "ORDER_NUMBER_GENERATOR",
+                "orders.numbering.TimeOrderedGenerator",
+            )
+        )()
+    return _generator
+
+
+def next_order_number():
+    return get_order_number_generator().next()
@@ -0,0 +1,161 @@
+"""
+Transactional email outbox
+
+EmailService writes emails to the EmailOutbox table instead of talking to
+SMTP during the request. Called inside a transaction, the email is
+committed (or rolled back) together with the order change that caused it.
+The run_email_worker command delivers the outbox in batches over pooled
+SMTP connections. Failed sends are retried with exponential backoff until
+EMAIL_OUTBOX_MAX_ATTEMPTS, then left as "failed" for an admin to look at.
+"""
+
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db.models import F, Q
+from django.utils import timezone
+from jigsimurherbal.mail_pool import get_connection_pool
+
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = getattr(settings, "EMAIL_OUTBOX_MAX_ATTEMPTS", 6)
+BACKOFF_BASE = getattr(settings, "EMAIL_OUTBOX_BACKOFF_BASE", 60)
+BACKOFF_MAX = getattr(settings, "EMAIL_OUTBOX_BACKOFF_MAX", 6 * 60 * 60)
+
+# A claimed email still "sending" after this long belongs to a worker that
+# died mid-batch and is handed out again
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def enqueue_email(subject, message, recipient_list, html_message=None, from_email=None):
+    return EmailOutbox.objects.create(
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipient_list),
+        subject=subject,
+        body=message,
+        html_body=html_message or "",
+    )
+
+
+def enqueue_emails(emails):
+    """Queue (subject, message, recipient_list, html_message) tuples in one insert"""
+    return EmailOutbox.objects.bulk_create(
+        [
+            EmailOutbox(
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                recipients=list(recipient_list),
+                subject=subject,
+                body=message,
+                html_body=html_message or "",
+            )
+            for subject, message, recipient_list, html_message in emails
+        ]
+    )
+
+
+def backoff_delay(attempts):
+    """Seconds to wait before the next try, doubling with each failure"""
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    # Jitter so emails that failed together don't all retry together
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_batch(size):
+    """Mark up to ``size`` due emails as sending and return them
+
+    Each row is claimed with a conditional UPDATE, so several workers can
+    drain the outbox without sending anything twice.
+    """
+    now = timezone.now()
+    due = Q(status="pending", next_attempt_at__lte=now) | Q(
+        status="sending", claimed_at__lt=now - CLAIM_TIMEOUT
+    )
+    candidates = EmailOutbox.objects.filter(due).order_by("next_attempt_at")
+    candidate_ids = list(candidates.values_list("id", flat=True)[:size])
+
+    claimed = []
+    for email_id in candidate_ids:
+        if (
+            EmailOutbox.objects.filter(due, id=email_id).update(
+                status="sending", claimed_at=now
+            )
+            == 1
+        ):
+            claimed.append(email_id)
+    return list(EmailOutbox.objects.filter(id__in=claimed).order_by("id"))
+
+
+def build_message(email, connection=None):
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email,
+        to=email.recipients,
+        connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, "text/html")
+    return message
+
+
+def record_failure(email, error):
+    email.attempts += 1
+    email.last_error = str(error)[:2000]
+    email.claimed_at = None
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = "failed"
+        logger.error(
+            "Giving up on email %s to %s after %s attempts: %s",
+            email.id,
+            email.recipients,
+            email.attempts,
+            error,
+        )
+    else:
+        email.status = "pending"
+        email.next_attempt_at = timezone.now() + timedelta(
+            seconds=backoff_delay(email.attempts)
+        )
+    email.save(
+        update_fields=[
+            "attempts",
+            "last_error",
+            "claimed_at",
+            "status",
+            "next_attempt_at",
+        ]
+    )
+
+
+def deliver_batch(emails):
+    """Send claimed emails over one pooled connection, returning (sent, failed)"""
+    results = get_connection_pool().send_messages(
+        [build_message(email) for email in emails]
+    )
+    sent_ids = []
+    for email, error in zip(emails, results):
+        if error is None:
+            sent_ids.append(email.id)
+        else:
+            record_failure(email, error)
+
+    EmailOutbox.objects.filter(id__in=sent_ids).update(
+        status="sent",
+        attempts=F("attempts") + 1,
+        sent_at=timezone.now(),
+        claimed_at=None,
+        last_error="",
+    )
+    return len(sent_ids), len(emails) - len(sent_ids)
+
+
+def retry_failed(queryset):
+    """Put dead-lettered emails back in the queue"""
+    return queryset.filter(status="failed").update(
+        status="pending", attempts=0, next_attempt_at=timezone.now()
+    )
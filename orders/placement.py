@@ -0,0 +1,191 @@
+"""
+Order placement
+
+An order, its lines and the stock decrements are written in one
+transaction. Stock is taken with a conditional UPDATE per product
+(``stock_quantity >= wanted``), so two buyers racing for the last units
+can't both succeed and no decrement is lost: the database checks and
+decrements in the same statement. Products are updated in id order, so
+concurrent checkouts lock rows in the same order and can't deadlock.
+
+Products sharded for a flash sale (see products.stock) take their units
+from StockShard rows instead, so buyers don't all queue on the product row.
+Buyers borrowing across shards can deadlock, so checkout runs in
+atomic_with_deadlock_retry(), which tries a transaction the database broke
+a deadlock in once more.
+
+If any product is short, the whole transaction is rolled back and
+OutOfStock lists every line that could not be filled.
+
+Each checkout form carries a one-off token saved on the order it creates.
+A resubmission with the same token finds that order (in the cache, falling
+back to the unique column) instead of placing another one.
+"""
+
+import secrets
+
+from django.core.cache import cache
+from django.db import OperationalError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from products.cache import bump_catalog_version
+from products.models import Product
+from products.stock import sharded_totals, take_sharded_stock
+
+from .models import CartItem, Order, OrderItem
+
+CHECKOUT_TOKEN_TIMEOUT = 60 * 60 * 24
+
+
+class OutOfStock(Exception):
+    def __init__(self, shortages):
+        # [(cart_item, units still available)]
+        self.shortages = shortages
+        super().__init__(
+            ", ".join(f"{item.product.name}: {left} left" for item, left in shortages)
+        )
+
+    @property
+    def messages(self):
+        return [
+            f"{item.product.name} has only {left} items in stock."
+            for item, left in self.shortages
+        ]
+
+
+def _take_stock(cart_items):
+    """Decrement stock for every cart line, returning the lines that were short"""
+    short = []
+    now = timezone.now()
+    for item in sorted(cart_items, key=lambda item: item.product_id):
+        if item.product.stock_shards:
+            if not (
+                item.product.is_available
+                and take_sharded_stock(item.product, item.quantity)
+            ):
+                short.append(item)
+            continue
+        updated = Product.objects.filter(
+            id=item.product_id,
+            is_available=True,
+            stock_quantity__gte=item.quantity,
+        ).update(stock_quantity=F("stock_quantity") - item.quantity, updated_at=now)
+        if not updated:
+            short.append(item)
+    return short
+
+
+def is_deadlock(error):
+    """Whether an OperationalError ended a transaction to break a deadlock"""
+    if connection.vendor == "mysql":
+        # ER_LOCK_DEADLOCK
+        return error.args[:1] == (1213,)
+    if connection.vendor == "postgresql":
+        # deadlock_detected, as psycopg2 and psycopg report it
+        cause = error.__cause__
+        code = getattr(cause, "pgcode", None) or getattr(cause, "sqlstate", None)
+        return code == "40P01"
+    return False
+
+
+def atomic_with_deadlock_retry(func):
+    """Call ``func`` in a transaction, once more if it lost a deadlock
+
+    The database rolls the whole transaction back when it breaks a
+    deadlock, so inside another transaction ``func`` is only tried once.
+    """
+    attempts = 1 if connection.in_atomic_block else 2
+    for attempt in range(attempts):
+        try:
+            with transaction.atomic():
+                return func()
+        except OperationalError as e:
+            if attempt == attempts - 1 or not is_deadlock(e):
+                raise
+
+
+def place_order(order, cart_items):
+    """Save ``order`` with one line per cart item and take the stock
+
+    ``cart_items`` must have their product loaded; the cart lines are
+    deleted once the order is written. Raises OutOfStock, leaving the
+    database untouched, when any line can't be filled.
+    """
+    cart_items = list(cart_items)
+    product_ids = [item.product_id for item in cart_items]
+
+    try:
+        with transaction.atomic():
+            short = _take_stock(cart_items)
+            if short:
+                raise OutOfStock([(item, None) for item in short])
+
+            order.save()
+            OrderItem.objects.bulk_create(
+                [
+                    OrderItem(
+                        order=order,
+                        product_id=item.product_id,
+                        product_name=item.product.name,
+                        product_price=item.product.price,
+                        quantity=item.quantity,
+                    )
+                    for item in cart_items
+                ]
+            )
+            CartItem.objects.filter(id__in=[item.id for item in cart_items]).delete()
+
+            # Queryset updates skip the post_save signal, so invalidate the
+            # cached listings here when a product just sold out. Sharded
+            # products are caught by products.stock.fold_stock() instead.
+            if Product.objects.filter(id__in=product_ids, stock_quantity=0).exists():
+                transaction.on_commit(bump_catalog_version)
+    except OutOfStock as e:
+        # Report what is left now that the transaction has rolled back
+        short_ids = [item.product_id for item, _ in e.shortages]
+        sharded = sharded_totals(short_ids)
+        stock = {
+            product_id: sharded.get(product_id, quantity) if available else 0
+            for product_id, quantity, available in Product.objects.filter(
+                id__in=short_ids
+            ).values_list("id", "stock_quantity", "is_available")
+        }
+        raise OutOfStock(
+            [(item, stock.get(item.product_id, 0)) for item, _ in e.shortages]
+        ) from None
+
+    return order
+
+
+def new_checkout_token():
+    return secrets.token_urlsafe(24)
+
+
+def _token_key(user, token):
+    return f"checkout_token:{user.pk}:{token}"
+
+
+def find_order_for_token(user, token):
+    """Id of the order already placed with this checkout token, if any"""
+    if not token:
+        return None
+    key = _token_key(user, token)
+    order_id = cache.get(key)
+    if order_id is None:
+        order_id = (
+            Order.objects.filter(user=user, checkout_token=token)
+            .values_list("id", flat=True)
+            .first()
+        )
+        if order_id is not None:
+            cache.set(key, order_id, CHECKOUT_TOKEN_TIMEOUT)
+    return order_id
+
+
+def remember_checkout_token(order):
+    if order.checkout_token:
+        cache.set(
+            _token_key(order.user, order.checkout_token),
+            order.id,
+            CHECKOUT_TOKEN_TIMEOUT,
+        )
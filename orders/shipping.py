@@ -0,0 +1,38 @@
+"""
+Cached shipping methods
+
+The active shipping methods are read on every checkout but only change
+from the admin, so they are cached until a ShippingMethod is saved or
+deleted (see orders.signals).
+"""
+
+from django.core.cache import cache
+
+from .models import ShippingMethod
+
+SHIPPING_METHODS_KEY = "shipping_methods:active"
+SHIPPING_METHODS_TIMEOUT = 60 * 60 * 24
+
+
+def get_shipping_methods():
+    methods = cache.get(SHIPPING_METHODS_KEY)
+    if methods is None:
+        methods = list(ShippingMethod.objects.filter(is_active=True).order_by("id"))
+        cache.set(SHIPPING_METHODS_KEY, methods, SHIPPING_METHODS_TIMEOUT)
+    return methods
+
+
+def get_shipping_method(method_id):
+    """The active shipping method with this id, or None"""
+    return next(
+        (
+            method
+            for method in get_shipping_methods()
+            if str(method.id) == str(method_id)
+        ),
+        None,
+    )
+
+
+def clear_shipping_methods():
+    cache.delete(SHIPPING_METHODS_KEY)
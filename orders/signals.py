@@ -0,0 +1,19 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .carts import get_cart_backend
+from .models import ShippingMethod
+from .shipping import clear_shipping_methods
+
+
+@receiver(user_logged_in)
+def merge_anonymous_cart(sender, request, user, **kwargs):
+    """Carry the cart built before signing in over to the user's cart"""
+    if request is not None:
+        get_cart_backend().merge(request, user)
+
+
+@receiver([post_save, post_delete], sender=ShippingMethod)
+def shipping_method_changed(sender, **kwargs):
+    clear_shipping_methods()
@@ -0,0 +1,327 @@
+import threading
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.db import OperationalError, connection, transaction
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from orders.carts import SessionCartBackend
+from orders.models import (
+    Cart,
+    CartItem,
+    EmailOutbox,
+    Order,
+    OrderItem,
+    ShippingMethod,
+)
+from orders.placement import OutOfStock, atomic_with_deadlock_retry, place_order
+from products.models import Category, Product
+from users.models import Address
+
+ADDRESS = {
+    f"{kind}_{field}": value
+    for kind in ("billing", "shipping")
+    for field, value in [
+        ("first_name", "Test"),
+        ("last_name", "Buyer"),
+        ("address_line_1", "1 Test Street"),
+        ("city", "Lagos"),
+        ("state", "Lagos"),
+        ("postal_code", "100001"),
+        ("country", "Nigeria"),
+    ]
+}
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Buyers racing for the last units must not oversell them"""
+
+    buyers = 50
+    stock = 10
+
+    def setUp(self):
+        category = Category.objects.create(name="Herbs", slug="herbs")
+        self.product = Product.objects.create(
+            name="Moringa",
+            slug="moringa",
+            description="Moringa leaf powder",
+            category=category,
+            price=1000,
+            stock_quantity=self.stock,
+            image="",
+        )
+
+    def race(self, quantity):
+        users = [User.objects.create(username=f"buyer-{i}") for i in range(self.buyers)]
+        items = [
+            CartItem.objects.create(
+                cart=Cart.objects.create(user=user),
+                product=self.product,
+                quantity=quantity,
+            )
+            for user in users
+        ]
+        results = {"placed": 0, "out_of_stock": 0, "errors": []}
+        lock = threading.Lock()
+        barrier = threading.Barrier(self.buyers)
+
+        def buy(user, item):
+            try:
+                cart_items = CartItem.objects.select_related("product").filter(
+                    id=item.id
+                )
+                order = Order(user=user, subtotal=1000, total_amount=1000, **ADDRESS)
+                barrier.wait()
+                try:
+                    place_order(order, cart_items)
+                    outcome = "placed"
+                except OutOfStock:
+                    outcome = "out_of_stock"
+                with lock:
+                    results[outcome] += 1
+            except (OperationalError, threading.BrokenBarrierError) as e:
+                with lock:
+                    results["errors"].append(str(e))
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=buy, args=(user, item))
+            for user, item in zip(users, items)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def assert_not_oversold(self, quantity):
+        results = self.race(quantity)
+        self.product.refresh_from_db()
+        sold = (
+            OrderItem.objects.filter(product=self.product).aggregate(
+                total=Sum("quantity")
+            )["total"]
+            or 0
+        )
+        self.assertEqual(results["errors"], [])
+        self.assertEqual(sold + self.product.stock_quantity, self.stock)
+        self.assertEqual(sold, self.stock // quantity * quantity)
+        self.assertEqual(results["placed"], self.stock // quantity)
+        self.assertEqual(results["placed"] + results["out_of_stock"], self.buyers)
+
+    def test_single_units(self):
+        self.assert_not_oversold(quantity=1)
+
+    def test_several_units(self):
+        self.assert_not_oversold(quantity=3)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class CheckoutTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("buyer", "buyer@example.com", "pw")
+        for kind in ("billing", "shipping"):
+            Address.objects.create(
+                user=cls.user,
+                type=kind,
+                first_name="Test",
+                last_name="Buyer",
+                address_line_1="1 Test Street",
+                city="Lagos",
+                state="Lagos",
+                postal_code="100001",
+                country="Nigeria",
+                is_default=True,
+            )
+        category = Category.objects.create(name="Herbs", slug="herbs")
+        cls.products = [
+            Product.objects.create(
+                name=f"Herb {i}",
+                slug=f"herb-{i}",
+                description="A herb",
+                category=category,
+                price=1000,
+                stock_quantity=10,
+                image="",
+            )
+            for i in range(12)
+        ]
+        cls.shipping_method = ShippingMethod.objects.create(
+            name="Standard", price=500, estimated_days=3
+        )
+        cls.cart = Cart.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def fill_cart(self, lines):
+        CartItem.objects.filter(cart=self.cart).delete()
+        CartItem.objects.bulk_create(
+            [
+                CartItem(cart=self.cart, product=product, quantity=1)
+                for product in self.products[:lines]
+            ]
+        )
+
+
+class CheckoutQueryCountTests(CheckoutTestCase):
+    """The checkout page costs the same queries however big the cart is"""
+
+    def count_queries(self, request):
+        # Warm the shipping method and cart count caches
+        self.fill_cart(1)
+        request()
+        counts = []
+        for lines in (1, 4, 12):
+            self.fill_cart(lines)
+            with CaptureQueriesContext(connection) as queries:
+                response = request()
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(queries))
+        return counts
+
+    def test_get(self):
+        counts = self.count_queries(lambda: self.client.get(reverse("orders:checkout")))
+        self.assertEqual(counts, [5, 5, 5])
+
+    def test_post_with_errors(self):
+        # An invalid form renders the page again, with the submitted cart
+        data = dict(ADDRESS)
+        data.update(payment_method="cash_on_delivery", shipping_method="999999")
+        counts = self.count_queries(
+            lambda: self.client.post(reverse("orders:checkout"), data)
+        )
+        self.assertEqual(counts, [5, 5, 5])
+
+
+class CheckoutEmailTests(CheckoutTestCase):
+    def checkout(self):
+        self.fill_cart(2)
+        data = dict(ADDRESS)
+        data.update(
+            payment_method="cash_on_delivery",
+            shipping_method=self.shipping_method.id,
+        )
+        return self.client.post(reverse("orders:checkout"), data)
+
+    @override_settings(EMAIL_DELIVERY="sync")
+    def test_sync_confirmation_is_sent_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.checkout()
+            # Nothing goes out while the order's stock is locked
+            self.assertEqual(len(mail.outbox), 0)
+        order = Order.objects.get(user=self.user)
+        self.assertRedirects(
+            response,
+            reverse("orders:order_confirmation", args=[order.id]),
+            fetch_redirect_response=False,
+        )
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(order.order_number, mail.outbox[0].subject)
+
+    @override_settings(EMAIL_DELIVERY="outbox")
+    def test_outbox_confirmation_is_queued_with_the_order(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.checkout()
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(callbacks, [])
+        self.assertTrue(
+            EmailOutbox.objects.filter(subject__contains=order.order_number).exists()
+        )
+
+
+class SessionCartMergeTests(TestCase):
+    """Signing in carries the session cart over to the user's cart"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("buyer", "buyer@example.com", "pw")
+        category = Category.objects.create(name="Herbs", slug="herbs")
+        cls.moringa, cls.ginger = [
+            Product.objects.create(
+                name=name,
+                slug=name.lower(),
+                description=name,
+                category=category,
+                price=1000,
+                stock_quantity=5,
+                image="",
+            )
+            for name in ("Moringa", "Ginger")
+        ]
+
+    def setUp(self):
+        patcher = mock.patch("orders.carts._backend", SessionCartBackend())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_login_merges_session_cart(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.moringa, quantity=3)
+        for product, quantity in [(self.moringa, 4), (self.ginger, 2)]:
+            self.client.post(
+                reverse("orders:add_to_cart", args=[product.id]),
+                {"quantity": quantity},
+            )
+        self.assertFalse(CartItem.objects.filter(cart__user__isnull=True).exists())
+
+        response = self.client.post(
+            reverse("users:login"), {"username": "buyer", "password": "pw"}
+        )
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            dict(cart.items.values_list("product__slug", "quantity")),
+            # Capped at the stock
+            {"moringa": 5, "ginger": 2},
+        )
+        self.assertNotIn("cart", self.client.session)
+
+
+class DeadlockRetryTests(TransactionTestCase):
+    """A transaction the database broke a deadlock in is tried once more"""
+
+    def flaky(self, failures):
+        calls = []
+
+        def func():
+            calls.append(connection.in_atomic_block)
+            if len(calls) <= failures:
+                raise OperationalError(1213, "Deadlock found")
+            return "placed"
+
+        return func, calls
+
+    @mock.patch("orders.placement.is_deadlock", return_value=True)
+    def test_retries_once(self, is_deadlock):
+        func, calls = self.flaky(failures=1)
+        self.assertEqual(atomic_with_deadlock_retry(func), "placed")
+        self.assertEqual(calls, [True, True])
+
+        func, calls = self.flaky(failures=2)
+        with self.assertRaises(OperationalError):
+            atomic_with_deadlock_retry(func)
+        self.assertEqual(len(calls), 2)
+
+    @mock.patch("orders.placement.is_deadlock", return_value=False)
+    def test_other_errors_are_not_retried(self, is_deadlock):
+        func, calls = self.flaky(failures=1)
+        with self.assertRaises(OperationalError):
+            atomic_with_deadlock_retry(func)
+        self.assertEqual(len(calls), 1)
+
+    @mock.patch("orders.placement.is_deadlock", return_value=True)
+    def test_not_retried_inside_a_transaction(self, is_deadlock):
+        func, calls = self.flaky(failures=1)
+        with self.assertRaises(OperationalError), transaction.atomic():
+            atomic_with_deadlock_retry(func)
+        self.assertEqual(len(calls), 1)
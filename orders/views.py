@@ -1,34 +1,44 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
+from django.db import IntegrityError, transaction
 from products.models import Product
-from .models import Cart, CartItem, Order, OrderItem, ShippingMethod
+from .models import Order
 from .forms import CheckoutForm
+from .cart_cache import set_cart_count
+from .carts import get_cart_backend
+from .shipping import get_shipping_method, get_shipping_methods
+from .placement import (
+    OutOfStock,
+    atomic_with_deadlock_retry,
+    find_order_for_token,
+    new_checkout_token,
+    place_order,
+    remember_checkout_token,
+)
 from users.models import Address
 import json
 
 
 def get_or_create_cart(request):
-    """Get or create cart for user or session"""
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-    else:
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.create()
-            session_key = request.session.session_key
-        cart, created = Cart.objects.get_or_create(session_key=session_key)
-    return cart
+    """Get or create cart for user or session
+
+    The storage depends on the CART_BACKEND setting (see orders.carts). The
+    cart is kept on the request so its summary is only computed once.
+    """
+    if not hasattr(request, "_cart"):
+        request._cart = get_cart_backend().get_cart(request)
+    return request._cart
 
 
 def cart_view(request):
     """View cart contents"""
     cart = get_or_create_cart(request)
-    cart_items = cart.items.all()
+    cart_items = cart.lines()
 
     context = {
         "cart": cart,
@@ -59,34 +69,30 @@ def add_to_cart(request, product_id):
         )
         return redirect("products:product_detail", slug=product.slug)
 
-    cart_item, created = CartItem.objects.get_or_create(
-        cart=cart, product=product, defaults={"quantity": quantity}
-    )
-
-    if not created:
-        new_quantity = cart_item.quantity + quantity
-        if new_quantity > product.stock_quantity:
-            if request.headers.get("Content-Type") == "application/json":
-                return JsonResponse(
-                    {
-                        "success": False,
-                        "message": f"Cannot add more items. Only {product.stock_quantity} available.",
-                    }
-                )
-            messages.error(
-                request,
-                f"Cannot add more items. Only {product.stock_quantity} available.",
+    # The stock ceiling is checked by the upsert itself
+    if not cart.add(product, quantity):
+        if request.headers.get("Content-Type") == "application/json":
+            return JsonResponse(
+                {
+                    "success": False,
+                    "message": f"Cannot add more items. Only {product.stock_quantity} available.",
+                }
             )
-            return redirect("products:product_detail", slug=product.slug)
-        cart_item.quantity = new_quantity
-        cart_item.save()
+        messages.error(
+            request,
+            f"Cannot add more items. Only {product.stock_quantity} available.",
+        )
+        return redirect("products:product_detail", slug=product.slug)
+
+    total_items = cart.total_items
+    set_cart_count(cart, total_items)
 
     if request.headers.get("Content-Type") == "application/json":
         return JsonResponse(
             {
                 "success": True,
                 "message": f"{product.name} added to cart.",
-                "cart_total_items": cart.total_items,
+                "cart_total_items": total_items,
                 "cart_total_price": str(cart.total_price),
             }
         )
@@ -99,24 +105,38 @@ def add_to_cart(request, product_id):
 def update_cart_item(request, item_id):
     """Update cart item quantity"""
     cart = get_or_create_cart(request)
-    cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
+    cart_item = cart.get_line(item_id)
+    if cart_item is None:
+        raise Http404("No such cart item.")
 
     quantity = int(request.POST.get("quantity", 1))
 
     if quantity <= 0:
-        cart_item.delete()
-        messages.success(request, "Item removed from cart.")
+        cart.set_quantity(cart_item.product, 0)
+        message = "Item removed from cart."
+    elif not cart.set_quantity(cart_item.product, quantity):
+        message = f"Only {cart_item.product.stock_quantity} items available."
+        if request.headers.get("Content-Type") == "application/json":
+            return JsonResponse({"success": False, "message": message})
+        messages.error(request, message)
+        return redirect("orders:cart")
     else:
-        if quantity > cart_item.product.stock_quantity:
-            messages.error(
-                request, f"Only {cart_item.product.stock_quantity} items available."
-            )
-            return redirect("orders:cart")
+        message = "Cart updated."
 
-        cart_item.quantity = quantity
-        cart_item.save()
-        messages.success(request, "Cart updated.")
+    total_items = cart.total_items
+    set_cart_count(cart, total_items)
 
+    if request.headers.get("Content-Type") == "application/json":
+        return JsonResponse(
+            {
+                "success": True,
+                "message": message,
+                "cart_total_items": total_items,
+                "cart_total_price": str(cart.total_price),
+            }
+        )
+
+    messages.success(request, message)
     return redirect("orders:cart")
 
 
@@ -124,16 +144,20 @@ def update_cart_item(request, item_id):
 def remove_from_cart(request, item_id):
     """Remove item from cart"""
     cart = get_or_create_cart(request)
-    cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
+    cart_item = cart.get_line(item_id)
+    if cart_item is None:
+        raise Http404("No such cart item.")
     product_name = cart_item.product.name
-    cart_item.delete()
+    cart.set_quantity(cart_item.product, 0)
+    total_items = cart.total_items
+    set_cart_count(cart, total_items)
 
     if request.headers.get("Content-Type") == "application/json":
         return JsonResponse(
             {
                 "success": True,
                 "message": f"{product_name} removed from cart.",
-                "cart_total_items": cart.total_items,
+                "cart_total_items": total_items,
                 "cart_total_price": str(cart.total_price),
             }
         )
@@ -145,8 +169,18 @@ def remove_from_cart(request, item_id):
 @login_required
 def checkout(request):
     """Checkout view"""
+    # A resubmitted form goes straight to the order it already placed
+    checkout_token = request.POST.get("checkout_token", "")[:64]
+    if request.method == "POST":
+        order_id = find_order_for_token(request.user, checkout_token)
+        if order_id is not None:
+            return redirect("orders:order_confirmation", order_id=order_id)
+
     cart = get_or_create_cart(request)
-    cart_items = cart.items.all()
+    # Lines, totals, addresses and shipping methods are each read once,
+    # however many items the cart holds
+    cart_items = list(cart.lines())
+    cart.summarize_lines(cart_items)
 
     if not cart_items:
         messages.error(request, "Your cart is empty.")
@@ -161,79 +195,62 @@ def checkout(request):
             )
             return redirect("orders:cart")
 
-    shipping_methods = ShippingMethod.objects.filter(is_active=True)
-    user_addresses = Address.objects.filter(user=request.user)
+    shipping_methods = get_shipping_methods()
+    user_addresses = list(Address.objects.filter(user=request.user))
 
     if request.method == "POST":
-        form = CheckoutForm(request.POST, user=request.user)
+        form = CheckoutForm(request.POST, user=request.user, addresses=user_addresses)
+        shipping_method_id = request.POST.get("shipping_method")
+        shipping_method = None
+        if shipping_method_id:
+            shipping_method = get_shipping_method(shipping_method_id)
+            if shipping_method is None:
+                form.add_error(None, "Please choose an available shipping method.")
         if form.is_valid():
             # Create order
             order = form.save(commit=False)
             order.user = request.user
             order.subtotal = cart.total_price
+            order.checkout_token = checkout_token or None
 
             # Calculate shipping and total
-            shipping_method_id = request.POST.get("shipping_method")
-            if shipping_method_id:
-                shipping_method = ShippingMethod.objects.get(id=shipping_method_id)
+            if shipping_method:
                 order.shipping_cost = shipping_method.price
 
             order.total_amount = order.subtotal + order.shipping_cost + order.tax_amount
-            order.save()
-
-            # Create order items
-            for cart_item in cart_items:
-                OrderItem.objects.create(
-                    order=order,
-                    product=cart_item.product,
-                    product_name=cart_item.product.name,
-                    product_price=cart_item.product.price,
-                    quantity=cart_item.quantity,
-                )
-
-                # Update product stock
-                cart_item.product.stock_quantity -= cart_item.quantity
-                cart_item.product.save()
-
-            # Clear cart
-            cart_items.delete()
-
-            # Send order confirmation email
+
+            # Save the order, its items, the stock changes and the queued
+            # confirmation email atomically
+            def save_order():
+                place_order(order, cart_items)
+                send_order_confirmation(order, request.user.email)
+
             try:
-                from jigsimurherbal.email_utils import EmailService
-                from django.template.loader import render_to_string
-                from django.utils.html import strip_tags
-
-                html_message = render_to_string(
-                    "emails/orders/order_confirmation.html",
-                    {
-                        "order": order,
-                        "website_url": settings.SITE_URL,
-                    },
-                )
-                plain_message = strip_tags(html_message)
-
-                EmailService.send_order_notification(
-                    subject=f"Order Confirmation - #{order.order_number}",
-                    message=plain_message,
-                    recipient_list=[request.user.email],
-                    html_message=html_message,
-                )
-            except Exception as e:
-                # Log error but don't fail the order
-                import logging
-
-                logging.error(f"Failed to send order confirmation email: {str(e)}")
+                atomic_with_deadlock_retry(save_order)
+            except OutOfStock as e:
+                for message in e.messages:
+                    messages.error(request, message)
+                return redirect("orders:cart")
+            except IntegrityError:
+                # A concurrent submission of the same form won the race
+                order_id = find_order_for_token(request.user, checkout_token)
+                if order_id is None:
+                    raise
+                return redirect("orders:order_confirmation", order_id=order_id)
+            remember_checkout_token(order)
+            set_cart_count(cart, 0)
 
             messages.success(
                 request, f"Order {order.order_number} placed successfully!"
             )
             return redirect("orders:order_confirmation", order_id=order.id)
     else:
-        form = CheckoutForm(user=request.user)
+        form = CheckoutForm(user=request.user, addresses=user_addresses)
+        checkout_token = new_checkout_token()
 
     context = {
         "form": form,
+        "checkout_token": checkout_token or new_checkout_token(),
         "cart": cart,
         "cart_items": cart_items,
         "shipping_methods": shipping_methods,
@@ -242,6 +259,46 @@ def checkout(request):
     return render(request, "orders/checkout.html", context)
 
 
+def send_order_confirmation(order, email):
+    """Queue the order confirmation email
+
+    In synchronous mode it is sent once the order is committed instead, so
+    the SMTP round trip doesn't hold the stock locks taken by place_order().
+    """
+    if getattr(settings, "EMAIL_DELIVERY", "outbox") == "sync":
+        transaction.on_commit(lambda: deliver_order_confirmation(order, email))
+    else:
+        deliver_order_confirmation(order, email)
+
+
+def deliver_order_confirmation(order, email):
+    from jigsimurherbal.email_render import render_email
+    from jigsimurherbal.email_utils import EmailService
+
+    try:
+        html_message, plain_message = render_email(
+            "emails/orders/order_confirmation.html",
+            {
+                "order": order,
+                "website_url": settings.SITE_URL,
+            },
+        )
+
+        # Savepoint, so a failure here doesn't take the order down with it
+        with transaction.atomic():
+            EmailService.send_order_notification(
+                subject=f"Order Confirmation - #{order.order_number}",
+                message=plain_message,
+                recipient_list=[email],
+                html_message=html_message,
+            )
+    except Exception as e:
+        # Log error but don't fail the order
+        import logging
+
+        logging.error(f"Failed to send order confirmation email: {str(e)}")
+
+
 @login_required
 def order_confirmation(request, order_id):
     """Order confirmation view"""
@@ -254,9 +311,3 @@ def order_detail(request, order_id):
     """Order detail view"""
     order = get_object_or_404(Order, id=order_id, user=request.user)
     return render(request, "orders/order_detail.html", {"order": order})
-
-
-def cart_items_count(request):
-    """Context processor for cart items count"""
-    cart = get_or_create_cart(request)
-    return {"cart_items_count": cart.total_items}
@@ -3,6 +3,9 @@ from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from .models import Category, Product, ProductImage, ProductReview
+from .cache import bump_catalog_version
+from .ratings import refresh_product_ratings
+from .stock import shard_stock, unshard_stock
 
 
 @admin.register(Category)
@@ -75,12 +78,14 @@ class ProductAdmin(admin.ModelAdmin):
     prepopulated_fields = {"slug": ("name",)}
     date_hierarchy = "created_at"
     inlines = [ProductImageInline]
-    readonly_fields = ["created_at", "updated_at", "image_preview"]
+    readonly_fields = ["created_at", "updated_at", "image_preview", "stock_shards"]
     actions = [
         "mark_as_featured",
         "mark_as_not_featured",
         "mark_as_available",
         "mark_as_unavailable",
+        "shard_stock_for_flash_sale",
+        "unshard_stock_after_flash_sale",
     ]
 
     fieldsets = (
@@ -104,7 +109,7 @@ class ProductAdmin(admin.ModelAdmin):
         ),
         (
             "Pricing & Inventory",
-            {"fields": ("price", "original_price", "stock_quantity")},
+            {"fields": ("price", "original_price", "stock_quantity", "stock_shards")},
         ),
         ("Media", {"fields": ("image", "image_preview")}),
         ("Status & Features", {"fields": ("is_available", "is_featured")}),
@@ -114,6 +119,13 @@ class ProductAdmin(admin.ModelAdmin):
         ),
     )
 
+    def get_readonly_fields(self, request, obj=None):
+        readonly_fields = super().get_readonly_fields(request, obj)
+        if obj and obj.stock_shards:
+            # The shards hold the stock, unshard the product to restock it
+            return [*readonly_fields, "stock_quantity"]
+        return readonly_fields
+
     def image_preview(self, obj):
         if obj.image:
             return mark_safe(
@@ -153,6 +165,7 @@ class ProductAdmin(admin.ModelAdmin):
 
     def mark_as_featured(self, request, queryset):
         queryset.update(is_featured=True)
+        bump_catalog_version()
         self.message_user(
             request, "{} products marked as featured.".format(queryset.count())
         )
@@ -161,6 +174,7 @@ class ProductAdmin(admin.ModelAdmin):
 
     def mark_as_not_featured(self, request, queryset):
         queryset.update(is_featured=False)
+        bump_catalog_version()
         self.message_user(
             request, "{} products unmarked as featured.".format(queryset.count())
         )
@@ -169,6 +183,7 @@ class ProductAdmin(admin.ModelAdmin):
 
     def mark_as_available(self, request, queryset):
         queryset.update(is_available=True)
+        bump_catalog_version()
         self.message_user(
             request, "{} products marked as available.".format(queryset.count())
         )
@@ -177,12 +192,30 @@ class ProductAdmin(admin.ModelAdmin):
 
     def mark_as_unavailable(self, request, queryset):
         queryset.update(is_available=False)
+        bump_catalog_version()
         self.message_user(
             request, "{} products marked as unavailable.".format(queryset.count())
         )
 
     mark_as_unavailable.short_description = "Mark as unavailable"
 
+    def shard_stock_for_flash_sale(self, request, queryset):
+        for product in queryset:
+            shard_stock(product)
+        self.message_user(
+            request, "{} products sharded for a flash sale.".format(queryset.count())
+        )
+
+    shard_stock_for_flash_sale.short_description = "Shard stock for a flash sale"
+
+    def unshard_stock_after_flash_sale(self, request, queryset):
+        for product in queryset.filter(stock_shards__gt=0):
+            unshard_stock(product)
+        bump_catalog_version()
+        self.message_user(request, "{} products unsharded.".format(queryset.count()))
+
+    unshard_stock_after_flash_sale.short_description = "Fold sharded stock back"
+
 
 @admin.register(ProductReview)
 class ProductReviewAdmin(admin.ModelAdmin):
@@ -219,18 +252,24 @@ class ProductReviewAdmin(admin.ModelAdmin):
     rating_display.short_description = "Rating"
 
     def approve_reviews(self, request, queryset):
-        queryset.update(is_approved=True)
-        self.message_user(
-            request, "{} reviews have been approved.".format(queryset.count())
+        product_ids = list(
+            queryset.order_by().values_list("product_id", flat=True).distinct()
         )
+        count = queryset.update(is_approved=True)
+        # queryset.update() skips the review signals
+        refresh_product_ratings(product_ids)
+        self.message_user(request, "{} reviews have been approved.".format(count))
 
     approve_reviews.short_description = "Approve selected reviews"
 
     def disapprove_reviews(self, request, queryset):
-        queryset.update(is_approved=False)
-        self.message_user(
-            request, "{} reviews have been disapproved.".format(queryset.count())
+        product_ids = list(
+            queryset.order_by().values_list("product_id", flat=True).distinct()
         )
+        count = queryset.update(is_approved=False)
+        # queryset.update() skips the review signals
+        refresh_product_ratings(product_ids)
+        self.message_user(request, "{} reviews have been disapproved.".format(count))
 
     disapprove_reviews.short_description = "Disapprove selected reviews"
 
@@ -0,0 +1,179 @@
+"""
+In-memory autocomplete for the search suggestions endpoint
+
+Each process keeps an index of available products with the suggestion
+payload already built. Words from the product name and short description
+go into a prefix trie; trigrams of the name give a fuzzy fallback when a
+typo means nothing matches by prefix.
+
+The index is tagged with the catalog version (see products.cache) and a
+process rebuilds it the next time it sees a different version.
+"""
+
+import heapq
+import re
+import threading
+import time
+from collections import defaultdict
+
+from .cache import get_catalog_version
+
+# Safety net for deployments without a shared cache backend, where a
+# version bump in one worker is invisible to the others
+MAX_INDEX_AGE = 300
+
+MAX_SUGGESTIONS = 10
+MIN_TRIGRAM_SIMILARITY = 0.5
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_words(text):
+    return _WORD_RE.findall((text or "").lower())
+
+
+def trigrams(text):
+    padded = "  " + " ".join(normalize_words(text)) + " "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class TrieNode:
+    __slots__ = ("children", "entries")
+
+    def __init__(self):
+        self.children = {}
+        self.entries = set()
+
+
+class PrefixTrie:
+    """Maps every prefix of every inserted word to the entries containing it"""
+
+    def __init__(self):
+        self.root = TrieNode()
+
+    def insert(self, word, entry_id):
+        node = self.root
+        for char in word:
+            node = node.children.setdefault(char, TrieNode())
+            node.entries.add(entry_id)
+
+    def lookup(self, prefix):
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return node.entries
+
+    def match_all(self, words):
+        """Entries that have a word starting with each of the given words"""
+        matches = None
+        for word in words:
+            found = self.lookup(word)
+            matches = set(found) if matches is None else matches & found
+            if not matches:
+                return set()
+        return matches
+
+
+class AutocompleteIndex:
+    def __init__(self, entries, version=None):
+        self.version = version
+        self.built_at = time.monotonic()
+        # Entry ids follow name order, so the smallest ids are the first
+        # suggestions alphabetically
+        self.entries = sorted(entries, key=lambda entry: entry["name"].lower())
+        self.name_trie = PrefixTrie()
+        self.text_trie = PrefixTrie()
+        self.trigram_index = defaultdict(set)
+
+        for entry_id, entry in enumerate(self.entries):
+            name_words = set(normalize_words(entry["name"]))
+            for word in name_words:
+                self.name_trie.insert(word, entry_id)
+            for word in name_words | set(normalize_words(entry["short_description"])):
+                self.text_trie.insert(word, entry_id)
+
+            for gram in trigrams(entry["name"]):
+                self.trigram_index[gram].add(entry_id)
+
+    def is_stale(self, version):
+        return (
+            self.version != version or time.monotonic() - self.built_at > MAX_INDEX_AGE
+        )
+
+    def _prefix_search(self, words):
+        # Products whose name matches come before description-only hits
+        results = heapq.nsmallest(MAX_SUGGESTIONS, self.name_trie.match_all(words))
+        if len(results) < MAX_SUGGESTIONS:
+            extra = self.text_trie.match_all(words).difference(results)
+            results += heapq.nsmallest(MAX_SUGGESTIONS - len(results), extra)
+        return results
+
+    def _trigram_search(self, query):
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+
+        shared = defaultdict(int)
+        for gram in query_grams:
+            for entry_id in self.trigram_index.get(gram, ()):
+                shared[entry_id] += 1
+
+        # Score by the share of the query's trigrams found in the name, so a
+        # misspelt word still matches a long product name
+        scored = [
+            (-count, entry_id)
+            for entry_id, count in shared.items()
+            if count / len(query_grams) >= MIN_TRIGRAM_SIMILARITY
+        ]
+        return [entry_id for _, entry_id in heapq.nsmallest(MAX_SUGGESTIONS, scored)]
+
+    def search(self, query):
+        words = normalize_words(query)
+        if not words:
+            return []
+        entry_ids = self._prefix_search(words) or self._trigram_search(query)
+        return [self.entries[entry_id]["payload"] for entry_id in entry_ids]
+
+
+def build_index(version=None):
+    from .models import Product
+
+    products = Product.objects.filter(is_available=True).only(
+        "name", "slug", "short_description", "price", "image"
+    )
+    entries = [
+        {
+            "name": product.name,
+            "short_description": product.short_description,
+            "payload": {
+                "name": product.name,
+                "url": product.get_absolute_url(),
+                "price": str(product.price),
+                "image": product.image.url if product.image else "",
+            },
+        }
+        for product in products
+    ]
+    return AutocompleteIndex(entries, version=version)
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_index():
+    """Return this process's index, rebuilding it if the version moved on"""
+    global _index
+    version = get_catalog_version()
+    if _index is None or _index.is_stale(version):
+        with _lock:
+            if _index is None or _index.is_stale(version):
+                _index = build_index(version)
+    return _index
+
+
+def suggest(query):
+    """Return suggestion payloads for a partially typed search query"""
+    return get_index().search(query)
@@ -0,0 +1,36 @@
+"""
+Catalog version stamp for cache keys
+
+Anything cached from the catalog (page fragments, product cards, facet
+counts, the autocomplete index) puts the current catalog version in its
+key. Product, Category and ProductImage signals and the bulk admin actions
+bump the version, which orphans every old entry at once, so nothing has to
+be deleted key by key or guessed with short timeouts.
+"""
+
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = "catalog:version"
+
+# Versioned entries never go stale, this just lets orphans age out
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate everything cached from the catalog"""
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOG_VERSION_KEY, 2, None)
+
+
+def catalog_cache_key(*parts):
+    return ":".join(["catalog", str(get_catalog_version())] + [str(p) for p in parts])
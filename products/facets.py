@@ -0,0 +1,165 @@
+"""
+Faceted navigation for the product list
+
+Facet counts for category, price range, stock and sale status are built
+with a single query grouped by category, using one conditional COUNT per
+facet value. Each facet ignores its own filter, so the sidebar shows what
+you would get by changing that filter, but respects all the others. The
+result is cached under a key built from the normalized filters and the
+catalog version.
+"""
+
+import hashlib
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Q
+
+from .cache import CATALOG_CACHE_TIMEOUT, catalog_cache_key
+
+# Upper bounds of the price buckets; the last bucket is open-ended
+PRICE_FACET_BOUNDARIES = getattr(
+    settings, "PRODUCT_PRICE_FACET_BOUNDARIES", [5000, 10000, 20000, 50000]
+)
+
+AVAILABILITY_CHOICES = ["in_stock", "out_of_stock"]
+
+
+def _parse_price(value):
+    try:
+        price = Decimal(value)
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    return price if price.is_finite() and price >= 0 else None
+
+
+def normalize_filters(params):
+    """Read the product list filters from a QueryDict into a plain dict"""
+    availability = params.get("availability")
+    return {
+        "search": " ".join((params.get("search") or "").lower().split()),
+        "category": params.get("category") or "",
+        "min_price": _parse_price(params.get("min_price")),
+        "max_price": _parse_price(params.get("max_price")),
+        "availability": availability if availability in AVAILABILITY_CHOICES else "",
+        "on_sale": params.get("on_sale") == "1",
+    }
+
+
+def _price_q(filters):
+    q = Q()
+    if filters["min_price"] is not None:
+        q &= Q(price__gte=filters["min_price"])
+    if filters["max_price"] is not None:
+        q &= Q(price__lte=filters["max_price"])
+    return q
+
+
+def _availability_q(availability):
+    if availability == "in_stock":
+        return Q(stock_quantity__gt=0)
+    if availability == "out_of_stock":
+        return Q(stock_quantity=0)
+    return Q()
+
+
+def _on_sale_q(on_sale):
+    return Q(original_price__gt=F("price")) if on_sale else Q()
+
+
+def apply_filters(queryset, filters):
+    """Apply every filter except search, which the caller has applied"""
+    if filters["category"]:
+        queryset = queryset.filter(category__slug=filters["category"])
+    return queryset.filter(
+        _price_q(filters),
+        _availability_q(filters["availability"]),
+        _on_sale_q(filters["on_sale"]),
+    )
+
+
+def price_buckets():
+    """(min, max) pairs for the price facet; max is None for the last one"""
+    bounds = [0] + list(PRICE_FACET_BOUNDARIES)
+    buckets = list(zip(bounds, bounds[1:]))
+    buckets.append((bounds[-1], None))
+    return buckets
+
+
+def _bucket_q(low, high):
+    q = Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+def facet_cache_key(filters):
+    payload = json.dumps(filters, sort_keys=True, default=str)
+    return catalog_cache_key("facets", hashlib.md5(payload.encode()).hexdigest())
+
+
+def compute_facets(base_queryset, filters):
+    price = _price_q(filters)
+    availability = _availability_q(filters["availability"])
+    on_sale = _on_sale_q(filters["on_sale"])
+
+    aggregates = {"matching": Count("id", filter=price & availability & on_sale)}
+    for index, (low, high) in enumerate(price_buckets()):
+        aggregates[f"price_{index}"] = Count(
+            "id", filter=_bucket_q(low, high) & availability & on_sale
+        )
+    aggregates["in_stock"] = Count(
+        "id", filter=price & _availability_q("in_stock") & on_sale
+    )
+    aggregates["out_of_stock"] = Count(
+        "id", filter=price & _availability_q("out_of_stock") & on_sale
+    )
+    aggregates["on_sale"] = Count("id", filter=price & availability & _on_sale_q(True))
+
+    rows = list(
+        base_queryset.order_by()
+        .values("category_id", "category__slug")
+        .annotate(**aggregates)
+    )
+
+    # Everything but the category facet is narrowed to the chosen category
+    selected = [
+        row
+        for row in rows
+        if not filters["category"] or row["category__slug"] == filters["category"]
+    ]
+
+    def total(key):
+        return sum(row[key] for row in selected)
+
+    return {
+        "categories": {row["category_id"]: row["matching"] for row in rows},
+        "price": [
+            {
+                "min": low,
+                # Buckets exclude their upper bound while max_price is
+                # inclusive, so link to the last cent below it
+                "max": None if high is None else Decimal(high) - Decimal("0.01"),
+                "count": total(f"price_{index}"),
+            }
+            for index, (low, high) in enumerate(price_buckets())
+        ],
+        "in_stock": total("in_stock"),
+        "out_of_stock": total("out_of_stock"),
+        "on_sale": total("on_sale"),
+    }
+
+
+def get_facets(base_queryset, filters):
+    """Facet counts for the product list, cached per filter set
+
+    ``base_queryset`` holds the available products matching the search
+    query, before any other filter is applied.
+    """
+    return cache.get_or_set(
+        facet_cache_key(filters),
+        lambda: compute_facets(base_queryset, filters),
+        CATALOG_CACHE_TIMEOUT,
+    )
@@ -0,0 +1,174 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from products.models import Category, Product
+from products.search import get_search_backend
+
+BENCHMARK_CATEGORY_SLUG = "search-benchmark"
+
+WORDS = [
+    "ginger",
+    "turmeric",
+    "moringa",
+    "hibiscus",
+    "neem",
+    "bitter",
+    "leaf",
+    "tea",
+    "capsules",
+    "tincture",
+    "powder",
+    "oil",
+    "extract",
+    "root",
+    "seed",
+    "immune",
+    "digestive",
+    "energy",
+    "heart",
+    "stress",
+    "skin",
+    "natural",
+    "organic",
+    "blend",
+    "herbal",
+    "wellness",
+    "detox",
+    "vitality",
+    "balm",
+    "garlic",
+    "honey",
+    "lemongrass",
+    "baobab",
+    "shea",
+    "cocoa",
+    "soursop",
+]
+
+# Filler vocabulary so that catalog words are reasonably selective
+SYLLABLES = ["ka", "lo", "mi", "ne", "su", "ta", "ri", "bo", "de", "fu", "ga", "hi"]
+FILLER = [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+
+QUERIES = ["ginger", "immune tea", "turmeric capsules", "moringa leaf powder", "xyzzy"]
+
+
+class Command(BaseCommand):
+    help = "Compare full-text search with the icontains lookup on a synthetic catalog"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=100000)
+        parser.add_argument("--runs", type=int, default=5)
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Keep the synthetic products instead of deleting them afterwards",
+        )
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        self.stdout.write(
+            f"Backend: {backend.__class__.__name__} on {connection.vendor}"
+        )
+
+        category = self.populate(options["products"])
+        try:
+            self.stdout.write(
+                f"{'query':<24}{'icontains ms':>14}{'full-text ms':>14}{'hits':>8}"
+            )
+            for query in QUERIES:
+                icontains_ms = self.time_path(
+                    self.icontains_page, query, options["runs"]
+                )
+                fulltext_ms = self.time_path(self.fulltext_page, query, options["runs"])
+                hits = get_search_backend().search(self.catalog(), query).count()
+                self.stdout.write(
+                    f"{query:<24}{icontains_ms:>14.2f}{fulltext_ms:>14.2f}{hits:>8}"
+                )
+        finally:
+            if not options["keep"]:
+                self.cleanup(category)
+
+    def populate(self, total):
+        # Unavailable products in an inactive category, so nothing on the
+        # storefront (listings, facets, caches, autocomplete) shows them
+        category, _ = Category.objects.update_or_create(
+            slug=BENCHMARK_CATEGORY_SLUG,
+            defaults={"name": "Search Benchmark", "is_active": False},
+        )
+        existing = Product.objects.filter(category=category).count()
+        if existing >= total:
+            return category
+
+        self.stdout.write(f"Creating {total - existing} synthetic products...")
+        rng = random.Random(42)
+        batch = []
+        for i in range(existing, total):
+            name = " ".join(rng.choices(WORDS, k=2) + rng.choices(FILLER, k=1)).title()
+            batch.append(
+                Product(
+                    name=name,
+                    slug=f"{BENCHMARK_CATEGORY_SLUG}-{i}",
+                    short_description=" ".join(
+                        rng.choices(WORDS, k=2) + rng.choices(FILLER, k=10)
+                    ),
+                    description=" ".join(
+                        rng.choices(WORDS, k=4) + rng.choices(FILLER, k=76)
+                    ),
+                    category=category,
+                    price=Decimal(rng.randint(500, 50000)),
+                    stock_quantity=rng.randint(0, 200),
+                    is_available=False,
+                    image="products/benchmark.jpg",
+                )
+            )
+            if len(batch) == 2000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Product.objects.bulk_create(batch)
+
+        # bulk_create skips signals, so index everything in one pass
+        get_search_backend().rebuild()
+        return category
+
+    def cleanup(self, category):
+        self.stdout.write("Removing synthetic products...")
+        # Through the ORM, so rows pointing at the products (cart lines,
+        # reviews, stock shards...) go with them
+        with transaction.atomic():
+            Product.objects.filter(category=category).delete()
+            category.delete()
+        get_search_backend().rebuild()
+
+    def catalog(self):
+        # The storefront's filter, inverted to pick the synthetic products.
+        # Filtering on the category instead makes SQLite probe the FTS table
+        # once per product, which isn't what a real search costs.
+        return Product.objects.filter(is_available=False)
+
+    def icontains_page(self, query):
+        products = self.catalog().filter(
+            Q(name__icontains=query)
+            | Q(description__icontains=query)
+            | Q(short_description__icontains=query)
+        )
+        products.count()
+        list(products[:12])
+
+    def fulltext_page(self, query):
+        products = get_search_backend().search(self.catalog(), query)
+        products.count()
+        list(products.order_by("-search_rank")[:12])
+
+    def time_path(self, func, query, runs):
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            func(query)
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,132 @@
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+from django.db.models import F, Sum
+from products.models import Category, Product, StockShard
+from products.stock import STOCK_SHARDS, shard_stock, take_sharded_stock
+
+BENCHMARK_CATEGORY_SLUG = "stock-benchmark"
+
+
+class Command(BaseCommand):
+    help = "Compare concurrent stock takes on one product row and on sharded stock"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument(
+            "--takes",
+            type=int,
+            default=50,
+            help="Units each thread takes, one at a time",
+        )
+        parser.add_argument("--shards", type=int, default=STOCK_SHARDS)
+        parser.add_argument(
+            "--hold",
+            type=float,
+            default=0.002,
+            help="Seconds each transaction stays open after its take, standing "
+            "in for writing the order",
+        )
+
+    def handle(self, *args, **options):
+        self.threads = options["threads"]
+        self.takes = options["takes"]
+        self.hold = options["hold"]
+        self.stdout.write(
+            f"{self.threads} threads x {self.takes} takes on {connection.vendor}"
+        )
+        if connection.vendor == "sqlite":
+            self.stdout.write(
+                "SQLite locks the whole database for writes, so sharding "
+                "can't help here; run this against PostgreSQL or MySQL."
+            )
+
+        category, _ = Category.objects.get_or_create(
+            slug=BENCHMARK_CATEGORY_SLUG, defaults={"name": "Stock Benchmark"}
+        )
+        failures = []
+        for label, shards in [
+            ("single row", 0),
+            (f"{options['shards']} shards", options["shards"]),
+        ]:
+            product = self.create_product(category)
+            try:
+                if shards:
+                    shard_stock(product, shards)
+                    product.refresh_from_db()
+                elapsed, taken, errors = self.race(product)
+                left = self.stock_left(product)
+                self.stdout.write(
+                    f"{label:<12} {taken / elapsed:>10,.0f} takes/s  "
+                    f"{elapsed:6.2f}s  {errors} errors  {left} left"
+                )
+                if taken + left != self.threads * self.takes:
+                    failures.append(f"{label}: {taken} taken but {left} left")
+            finally:
+                product.delete()
+
+        if failures:
+            raise CommandError("Stock accounting is off: " + "; ".join(failures))
+
+    def create_product(self, category):
+        run = uuid.uuid4().hex[:8]
+        return Product.objects.create(
+            name=f"Stock benchmark {run}",
+            slug=f"stock-benchmark-{run}",
+            description="Created by the benchmark_stock_shards command",
+            category=category,
+            price=1000,
+            stock_quantity=self.threads * self.takes,
+            image="",
+        )
+
+    def take_from_row(self, product):
+        return Product.objects.filter(id=product.id, stock_quantity__gte=1).update(
+            stock_quantity=F("stock_quantity") - 1
+        )
+
+    def stock_left(self, product):
+        if product.stock_shards:
+            return StockShard.objects.filter(product=product).aggregate(
+                total=Sum("quantity")
+            )["total"]
+        product.refresh_from_db()
+        return product.stock_quantity
+
+    def race(self, product):
+        take = take_sharded_stock if product.stock_shards else None
+        counts = {"taken": 0, "errors": 0}
+        lock = threading.Lock()
+        barrier = threading.Barrier(self.threads)
+
+        def buyer():
+            taken = errors = 0
+            try:
+                barrier.wait()
+                for _ in range(self.takes):
+                    try:
+                        with transaction.atomic():
+                            if take:
+                                done = take(product, 1)
+                            else:
+                                done = self.take_from_row(product)
+                            time.sleep(self.hold)
+                        taken += bool(done)
+                    except OperationalError:
+                        errors += 1
+            finally:
+                connection.close()
+                with lock:
+                    counts["taken"] += taken
+                    counts["errors"] += errors
+
+        threads = [threading.Thread(target=buyer) for _ in range(self.threads)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.monotonic() - started, counts["taken"], counts["errors"]
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+from products.recommendations import (
+    CHUNK_SIZE,
+    PARTITION_SIZE,
+    TOP_NEIGHBOURS,
+    compute_related_products,
+)
+
+
+class Command(BaseCommand):
+    help = "Precompute frequently-bought-together related products from order history"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=TOP_NEIGHBOURS,
+            help="Neighbours kept per product",
+        )
+        parser.add_argument(
+            "--partition-size",
+            type=int,
+            default=PARTITION_SIZE,
+            help="Product ids counted per pass over the order lines",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CHUNK_SIZE,
+            help="Order lines fetched per database round trip",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Computing related products...")
+        started = time.monotonic()
+        count = compute_related_products(
+            top=options["top"],
+            partition_size=options["partition_size"],
+            chunk_size=options["chunk_size"],
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(f"Stored {count} related products in {elapsed:.1f}s.")
+        )
@@ -0,0 +1,31 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from products.stock import fold_stock
+
+
+class Command(BaseCommand):
+    help = "Keep the stock of sharded flash-sale products folded into stock_quantity"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Fold once and exit")
+        parser.add_argument(
+            "--interval", type=float, default=5, help="Seconds between folds"
+        )
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        while self.running:
+            changed = fold_stock()
+            if changed or options["once"]:
+                self.stdout.write(f"Folded stock for {changed} products")
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
+
+    def stop(self, signum, frame):
+        self.running = False
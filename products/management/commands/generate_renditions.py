@@ -0,0 +1,81 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from products.models import Category, Product, ProductImage
+from products.renditions import generate_renditions
+from users.models import UserProfile
+
+IMAGE_FIELDS = [
+    (Product, "image"),
+    (ProductImage, "image"),
+    (Category, "image"),
+    (UserProfile, "avatar"),
+]
+
+
+def _setup_worker():
+    # Needed when workers are spawned rather than forked
+    django.setup()
+
+
+def _render(name, force):
+    try:
+        return name, generate_renditions(name, force=force), None
+    except Exception as e:
+        return name, 0, str(e)
+
+
+class Command(BaseCommand):
+    help = "Generate responsive renditions for every stored catalog image and avatar"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Worker processes (defaults to the number of CPUs)",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Regenerate renditions that already exist",
+        )
+
+    def handle(self, *args, **options):
+        names = set()
+        for model, field in IMAGE_FIELDS:
+            names.update(
+                model.objects.exclude(**{field: ""})
+                .exclude(**{f"{field}__isnull": True})
+                .values_list(field, flat=True)
+            )
+        names = sorted(names)
+        self.stdout.write(f"Generating renditions for {len(names)} images...")
+
+        started = time.monotonic()
+        written = failed = 0
+        # Resizing is CPU bound, so spread it over processes; workers only
+        # touch file storage, never the database
+        with ProcessPoolExecutor(
+            max_workers=options["workers"], initializer=_setup_worker
+        ) as executor:
+            futures = [
+                executor.submit(_render, name, options["force"]) for name in names
+            ]
+            for future in as_completed(futures):
+                name, count, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(f"  {name}: {error}")
+                else:
+                    written += count
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {written} renditions for {len(names) - failed} images "
+                f"in {elapsed:.1f}s ({failed} failed)."
+            )
+        )
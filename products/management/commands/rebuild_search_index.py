@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from products.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text product search index"
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        self.stdout.write(f"Rebuilding search index ({backend.__class__.__name__})...")
+        count = backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} products."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from products.ratings import BATCH_SIZE, recompute_all_ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized review aggregates on every product"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        self.stdout.write("Recomputing product ratings...")
+        count = recompute_all_ratings(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Updated ratings for {count} products."))
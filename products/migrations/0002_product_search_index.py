@@ -0,0 +1,70 @@
+from django.db import migrations
+
+# The DDL is spelled out here rather than taken from products.search, so
+# later changes to the search backends don't change what this migration does
+
+SQLITE_FTS_TABLE = "products_product_fts"
+POSTGRES_INDEX = "products_product_search_idx"
+POSTGRES_VECTOR = (
+    "(setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(short_description, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C'))"
+)
+MYSQL_INDEX = "products_product_fulltext"
+
+
+def sqlite_has_fts5(cursor):
+    cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+    return bool(cursor.fetchone()[0])
+
+
+def install_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == "sqlite":
+            # Without FTS5 search falls back to icontains
+            if not sqlite_has_fts5(cursor):
+                return
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} "
+                "USING fts5(name, short_description, description, "
+                "tokenize='porter unicode61')"
+            )
+            cursor.execute(f"DELETE FROM {SQLITE_FTS_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {SQLITE_FTS_TABLE} "
+                "(rowid, name, short_description, description) "
+                "SELECT id, name, short_description, description FROM products_product"
+            )
+        elif vendor == "postgresql":
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {POSTGRES_INDEX} ON products_product "
+                f"USING GIN ({POSTGRES_VECTOR})"
+            )
+        elif vendor == "mysql":
+            cursor.execute(
+                f"ALTER TABLE products_product ADD FULLTEXT INDEX {MYSQL_INDEX} "
+                "(name, short_description, description)"
+            )
+
+
+def uninstall_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == "sqlite":
+            cursor.execute(f"DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}")
+        elif vendor == "postgresql":
+            cursor.execute(f"DROP INDEX IF EXISTS {POSTGRES_INDEX}")
+        elif vendor == "mysql":
+            cursor.execute(f"ALTER TABLE products_product DROP INDEX {MYSQL_INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:26
+
+from django.db import migrations, models
+from django.db.models import Count
+import products.models
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    ProductReview = apps.get_model("products", "ProductReview")
+
+    histograms = {}
+    rows = (
+        ProductReview.objects.filter(is_approved=True)
+        .values_list("product_id", "rating")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    for product_id, rating, count in rows:
+        histogram = histograms.setdefault(product_id, [0, 0, 0, 0, 0])
+        if 1 <= rating <= 5:
+            histogram[rating - 1] = count
+
+    for product_id, histogram in histograms.items():
+        review_count = sum(histogram)
+        if not review_count:
+            continue
+        total = sum(stars * count for stars, count in enumerate(histogram, 1))
+        Product.objects.filter(id=product_id).update(
+            avg_rating=round(total / review_count, 2),
+            review_count=review_count,
+            rating_histogram=histogram,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0002_product_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="avg_rating",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_histogram",
+            field=models.JSONField(default=products.models.empty_rating_histogram),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="review_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
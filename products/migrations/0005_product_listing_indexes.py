@@ -0,0 +1,71 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:35
+
+from django.db import migrations, models
+
+# Partial indexes only help SQLite and PostgreSQL. MySQL would create them
+# without their condition, next to the plain ones it gets in 0007
+VENDORS = {"sqlite", "postgresql"}
+
+INDEXES = [
+    models.Index(
+        condition=models.Q(("is_available", True)),
+        fields=["created_at", "id"],
+        name="product_avail_created_idx",
+    ),
+    models.Index(
+        condition=models.Q(("is_available", True)),
+        fields=["price", "id"],
+        name="product_avail_price_idx",
+    ),
+    models.Index(
+        condition=models.Q(("is_available", True)),
+        fields=["name", "id"],
+        name="product_avail_name_idx",
+    ),
+    models.Index(
+        condition=models.Q(("is_available", True)),
+        fields=["category", "created_at", "id"],
+        name="product_avail_cat_created_idx",
+    ),
+    models.Index(
+        condition=models.Q(("is_available", True)),
+        fields=["category", "price", "id"],
+        name="product_avail_cat_price_idx",
+    ),
+    models.Index(
+        condition=models.Q(("is_available", True), ("is_featured", True)),
+        fields=["created_at"],
+        name="product_featured_idx",
+    ),
+]
+
+
+def add_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor in VENDORS:
+        product = apps.get_model("products", "Product")
+        for index in INDEXES:
+            schema_editor.add_index(product, index)
+
+
+def remove_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor in VENDORS:
+        product = apps.get_model("products", "Product")
+        for index in INDEXES:
+            schema_editor.remove_index(product, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0004_related_product"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(add_indexes, remove_indexes)],
+            state_operations=[
+                migrations.AddIndex(model_name="product", index=index)
+                for index in INDEXES
+            ],
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:28
+
+from django.db import migrations, models
+
+# Like the partial indexes of 0005, only created where they are used
+PARTIAL_VENDORS = {"sqlite", "postgresql"}
+
+PARTIAL_INDEXES = [
+    models.Index(
+        condition=models.Q(("is_available", True)),
+        fields=["category", "name", "id"],
+        name="product_avail_cat_name_idx",
+    ),
+]
+
+# MySQL compares is_available = 1, so plain indexes leading with it serve
+# its listings
+PLAIN_VENDORS = {"mysql"}
+
+PLAIN_INDEXES = [
+    models.Index(
+        fields=["is_available", "created_at", "id"],
+        name="prod_list_created_idx",
+    ),
+    models.Index(fields=["is_available", "price", "id"], name="prod_list_price_idx"),
+    models.Index(fields=["is_available", "name", "id"], name="prod_list_name_idx"),
+    models.Index(
+        fields=["is_available", "category", "created_at", "id"],
+        name="prod_list_cat_created_idx",
+    ),
+    models.Index(
+        fields=["is_available", "category", "price", "id"],
+        name="prod_list_cat_price_idx",
+    ),
+    models.Index(
+        fields=["is_available", "category", "name", "id"],
+        name="prod_list_cat_name_idx",
+    ),
+    models.Index(
+        fields=["is_available", "is_featured", "created_at"],
+        name="prod_list_featured_idx",
+    ),
+]
+
+
+def vendor_indexes(vendor):
+    if vendor in PARTIAL_VENDORS:
+        return PARTIAL_INDEXES
+    if vendor in PLAIN_VENDORS:
+        return PLAIN_INDEXES
+    return []
+
+
+def add_indexes(apps, schema_editor):
+    product = apps.get_model("products", "Product")
+    for index in vendor_indexes(schema_editor.connection.vendor):
+        schema_editor.add_index(product, index)
+
+
+def remove_indexes(apps, schema_editor):
+    product = apps.get_model("products", "Product")
+    for index in vendor_indexes(schema_editor.connection.vendor):
+        schema_editor.remove_index(product, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0006_product_stock_shards"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(add_indexes, remove_indexes)],
+            state_operations=[
+                migrations.AddIndex(model_name="product", index=index)
+                for index in PARTIAL_INDEXES + PLAIN_INDEXES
+            ],
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.urls import reverse
 from django.contrib.auth.models import User
+from django.utils.functional import cached_property
 
 
 class Category(models.Model):
@@ -23,6 +24,11 @@ class Category(models.Model):
         return reverse("products:category_detail", kwargs={"slug": self.slug})
 
 
+def empty_rating_histogram():
+    """Review counts for 1 to 5 stars"""
+    return [0, 0, 0, 0, 0]
+
+
 class Product(models.Model):
     name = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
@@ -37,6 +43,9 @@ class Product(models.Model):
     )
     image = models.ImageField(upload_to="products/")
     stock_quantity = models.PositiveIntegerField(default=0)
+    # Above 0, the stock is split across this many StockShard rows (see
+    # products.stock) and stock_quantity is a periodically folded total
+    stock_shards = models.PositiveSmallIntegerField(default=0, editable=False)
     is_available = models.BooleanField(default=True)
     is_featured = models.BooleanField(default=False)
     weight = models.CharField(max_length=50, blank=True)
@@ -44,11 +53,87 @@ class Product(models.Model):
     usage_instructions = models.TextField(blank=True)
     benefits = models.TextField(blank=True)
     warnings = models.TextField(blank=True)
+
+    # Review aggregates, maintained by products.ratings
+    avg_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    rating_histogram = models.JSONField(default=empty_rating_histogram)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["-created_at"]
+        # Listings only ever show available products, sorted (and keyset
+        # paginated) on (sort field, id), so the indexes end with id. The
+        # partial ones serve PostgreSQL and SQLite, which filter on a bare
+        # "WHERE is_available". MySQL can't make partial indexes but compares
+        # is_available = 1, so it gets plain ones leading with is_available.
+        # Migrations 0005 and 0007 only create each set on the engines it
+        # serves.
+        indexes = [
+            models.Index(
+                fields=["created_at", "id"],
+                name="product_avail_created_idx",
+                condition=models.Q(is_available=True),
+            ),
+            models.Index(
+                fields=["price", "id"],
+                name="product_avail_price_idx",
+                condition=models.Q(is_available=True),
+            ),
+            models.Index(
+                fields=["name", "id"],
+                name="product_avail_name_idx",
+                condition=models.Q(is_available=True),
+            ),
+            models.Index(
+                fields=["category", "created_at", "id"],
+                name="product_avail_cat_created_idx",
+                condition=models.Q(is_available=True),
+            ),
+            models.Index(
+                fields=["category", "price", "id"],
+                name="product_avail_cat_price_idx",
+                condition=models.Q(is_available=True),
+            ),
+            models.Index(
+                fields=["category", "name", "id"],
+                name="product_avail_cat_name_idx",
+                condition=models.Q(is_available=True),
+            ),
+            models.Index(
+                fields=["created_at"],
+                name="product_featured_idx",
+                condition=models.Q(is_available=True, is_featured=True),
+            ),
+            models.Index(
+                fields=["is_available", "created_at", "id"],
+                name="prod_list_created_idx",
+            ),
+            models.Index(
+                fields=["is_available", "price", "id"], name="prod_list_price_idx"
+            ),
+            models.Index(
+                fields=["is_available", "name", "id"], name="prod_list_name_idx"
+            ),
+            models.Index(
+                fields=["is_available", "category", "created_at", "id"],
+                name="prod_list_cat_created_idx",
+            ),
+            models.Index(
+                fields=["is_available", "category", "price", "id"],
+                name="prod_list_cat_price_idx",
+            ),
+            models.Index(
+                fields=["is_available", "category", "name", "id"],
+                name="prod_list_cat_name_idx",
+            ),
+            models.Index(
+                fields=["is_available", "is_featured", "created_at"],
+                name="prod_list_featured_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -66,13 +151,51 @@ class Product(models.Model):
             return int(((self.original_price - self.price) / self.original_price) * 100)
         return 0
 
+    @cached_property
+    def available_quantity(self):
+        """Units on sale, read from the shards for sharded products"""
+        if self.stock_shards:
+            from .stock import available_stock
+
+            return available_stock(self)
+        return self.stock_quantity
+
     @property
     def is_in_stock(self):
-        return self.stock_quantity > 0
+        return self.available_quantity > 0
 
     def get_display_price(self):
         return self.price
 
+    @property
+    def rating_distribution(self):
+        """(stars, count, percentage) rows from 5 stars down, for templates"""
+        total = self.review_count or 1
+        return [
+            (stars, count, int(count * 100 / total))
+            for stars, count in reversed(list(enumerate(self.rating_histogram, 1)))
+        ]
+
+
+class StockShard(models.Model):
+    """A slice of a flash-sale product's stock, see products.stock"""
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="shards"
+    )
+    shard = models.PositiveSmallIntegerField()
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "shard"], name="products_stockshard_shard"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.product} shard {self.shard}: {self.quantity}"
+
 
 class ProductImage(models.Model):
     product = models.ForeignKey(
@@ -117,3 +240,27 @@ class ProductReview(models.Model):
 
     def __str__(self):
         return f"{self.product.name} - {self.user.username} - {self.rating} stars"
+
+
+class RelatedProduct(models.Model):
+    """Products most often bought together with another, precomputed from orders"""
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="neighbours"
+    )
+    related = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="related_to"
+    )
+    score = models.PositiveIntegerField()  # Orders containing both products
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ["product", "rank"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "rank"], name="products_relatedproduct_rank"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} -> {self.related.name} ({self.score})"
@@ -0,0 +1,202 @@
+"""
+Keyset (cursor) pagination for product listings
+
+Offset pagination costs a COUNT(*) per page and an OFFSET scan that grows
+with page depth. Here each page link carries an opaque cursor holding the
+sort value and id of the last (or first) product shown, and the next page
+is fetched with a range condition on (sort field, id), which an index can
+satisfy directly however deep the page is.
+
+The total count is optional and cached per catalog version, since it is
+only used for the "Showing X-Y of N" label.
+"""
+
+import base64
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .cache import CATALOG_CACHE_TIMEOUT, catalog_cache_key
+
+KEYSET_SORTS = ["name", "-name", "price", "-price", "created_at", "-created_at"]
+
+
+def encode_cursor(value, pk, offset, backwards=False):
+    payload = json.dumps([value, pk, offset, backwards], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    value, pk, offset, backwards = json.loads(base64.urlsafe_b64decode(padded))
+    return value, int(pk), max(int(offset), 0), bool(backwards)
+
+
+def page_query(params, **changes):
+    """Copy of the current query string with pagination keys replaced"""
+    query = params.copy()
+    for key in ("page", "cursor"):
+        query.pop(key, None)
+    for key, value in changes.items():
+        query[key] = value
+    return query.urlencode()
+
+
+class KeysetPaginator:
+    def __init__(
+        self, queryset, per_page, ordering, count_timeout=CATALOG_CACHE_TIMEOUT
+    ):
+        self.per_page = per_page
+        self.field = ordering.lstrip("-")
+        self.descending = ordering.startswith("-")
+        self.count_timeout = count_timeout
+        self.unordered = queryset.order_by()
+        self.queryset = queryset.order_by(*self._ordering(backwards=False))
+
+    def _ordering(self, backwards):
+        prefix = "-" if self.descending != backwards else ""
+        return [prefix + self.field, prefix + "id"]
+
+    def _beyond(self, value, pk, backwards):
+        lookup = "lt" if self.descending != backwards else "gt"
+        return Q(**{f"{self.field}__{lookup}": value}) | Q(
+            **{self.field: value, f"id__{lookup}": pk}
+        )
+
+    def _key(self, product):
+        value = getattr(product, self.field)
+        if hasattr(value, "isoformat"):
+            return value.isoformat()
+        return str(value)
+
+    @cached_property
+    def count(self):
+        """Total number of results, or None when counting is disabled"""
+        if self.count_timeout is None:
+            return None
+        digest = hashlib.md5(str(self.unordered.query).encode()).hexdigest()
+        return cache.get_or_set(
+            catalog_cache_key("count", digest), self.unordered.count, self.count_timeout
+        )
+
+    def get_page(self, cursor, params):
+        value = pk = None
+        offset, backwards = 0, False
+        if cursor:
+            try:
+                value, pk, offset, backwards = decode_cursor(cursor)
+                value = self.queryset.model._meta.get_field(self.field).to_python(value)
+            except (ValueError, TypeError, ValidationError):
+                value = pk = None
+                offset, backwards = 0, False
+
+        if pk is None:
+            products = list(self.queryset[: self.per_page + 1])
+            has_previous = False
+            has_next = len(products) > self.per_page
+            products = products[: self.per_page]
+        elif not backwards:
+            products = list(
+                self.queryset.filter(self._beyond(value, pk, backwards=False))[
+                    : self.per_page + 1
+                ]
+            )
+            has_previous = True
+            has_next = len(products) > self.per_page
+            products = products[: self.per_page]
+        else:
+            products = list(
+                self.unordered.filter(self._beyond(value, pk, backwards=True)).order_by(
+                    *self._ordering(backwards=True)
+                )[: self.per_page + 1]
+            )
+            has_previous = len(products) > self.per_page
+            products = products[: self.per_page][::-1]
+            has_next = True
+            if not has_previous:
+                offset = 0
+
+        if not products and pk is not None:
+            # Stale cursor pointing past the results, start over
+            return self.get_page(None, params)
+
+        return KeysetPage(self, products, offset, has_previous, has_next, params)
+
+
+class KeysetPage:
+    def __init__(self, paginator, products, offset, has_previous, has_next, params):
+        self.paginator = paginator
+        self.object_list = products
+        self.offset = offset
+        self._has_previous = has_previous
+        self._has_next = has_next
+        self.params = params
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    def start_index(self):
+        return self.offset + 1 if self.object_list else 0
+
+    def end_index(self):
+        return self.offset + len(self.object_list)
+
+    @property
+    def previous_link(self):
+        first = self.object_list[0]
+        cursor = encode_cursor(
+            self.paginator._key(first),
+            first.pk,
+            max(self.offset - self.paginator.per_page, 0),
+            backwards=True,
+        )
+        return page_query(self.params, cursor=cursor)
+
+    @property
+    def next_link(self):
+        last = self.object_list[-1]
+        cursor = encode_cursor(
+            self.paginator._key(last), last.pk, self.offset + len(self.object_list)
+        )
+        return page_query(self.params, cursor=cursor)
+
+
+def paginate_products(request, queryset, sort_by, per_page=12):
+    """Paginate a product listing, by cursor when the sort allows it
+
+    Old ``?page=N`` links and sorts without a keyset (search relevance)
+    still go through Django's offset Paginator.
+    """
+    params = request.GET
+    if sort_by in KEYSET_SORTS and "page" not in params:
+        paginator = KeysetPaginator(queryset, per_page, sort_by)
+        return paginator.get_page(params.get("cursor"), params)
+
+    page_obj = Paginator(queryset, per_page).get_page(params.get("page"))
+    if page_obj.has_previous():
+        page_obj.previous_link = page_query(
+            params, page=page_obj.previous_page_number()
+        )
+    if page_obj.has_next():
+        page_obj.next_link = page_query(params, page=page_obj.next_page_number())
+    return page_obj
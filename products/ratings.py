@@ -0,0 +1,102 @@
+"""
+Denormalized review aggregates on Product
+
+Product.avg_rating, review_count and rating_histogram are recomputed from
+the approved reviews whenever reviews change, so listings and the detail
+page can show ratings without aggregating ProductReview per request.
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Product, ProductReview, empty_rating_histogram
+
+BATCH_SIZE = 1000
+
+
+def _aggregate(product_ids):
+    """Build {product_id: (avg_rating, review_count, histogram)}"""
+    histograms = {product_id: empty_rating_histogram() for product_id in product_ids}
+    rows = (
+        ProductReview.objects.filter(product_id__in=product_ids, is_approved=True)
+        .values_list("product_id", "rating")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    for product_id, rating, count in rows:
+        if 1 <= rating <= 5:
+            histograms[product_id][rating - 1] = count
+
+    aggregates = {}
+    for product_id, histogram in histograms.items():
+        review_count = sum(histogram)
+        avg_rating = Decimal(0)
+        if review_count:
+            total = sum(stars * count for stars, count in enumerate(histogram, 1))
+            avg_rating = (Decimal(total) / review_count).quantize(
+                Decimal("0.01"), rounding=ROUND_HALF_UP
+            )
+        aggregates[product_id] = (avg_rating, review_count, histogram)
+    return aggregates
+
+
+def refresh_product_ratings(product_ids):
+    """Recompute the review aggregates for the given products
+
+    The product rows are locked (in id order, so concurrent refreshes can't
+    deadlock) for the duration of the recompute, so two review writes on
+    the same product can't store a stale result over a newer one.
+    """
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return
+
+    with transaction.atomic():
+        locked = list(
+            Product.objects.select_for_update()
+            .filter(id__in=product_ids)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        for product_id, (avg_rating, review_count, histogram) in _aggregate(
+            locked
+        ).items():
+            Product.objects.filter(id=product_id).update(
+                avg_rating=avg_rating,
+                review_count=review_count,
+                rating_histogram=histogram,
+            )
+
+
+def recompute_all_ratings(batch_size=BATCH_SIZE):
+    """Rebuild the aggregates for every product, batch by batch"""
+    updated = 0
+    last_id = 0
+    while True:
+        product_ids = list(
+            Product.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not product_ids:
+            return updated
+        last_id = product_ids[-1]
+
+        products = [
+            Product(
+                id=product_id,
+                avg_rating=avg_rating,
+                review_count=review_count,
+                rating_histogram=histogram,
+            )
+            for product_id, (avg_rating, review_count, histogram) in _aggregate(
+                product_ids
+            ).items()
+        ]
+        with transaction.atomic():
+            Product.objects.bulk_update(
+                products, ["avg_rating", "review_count", "rating_histogram"]
+            )
+        updated += len(products)
@@ -0,0 +1,118 @@
+"""
+"Frequently bought together" related products
+
+The compute_related_products command streams order lines grouped by order
+and counts, for every pair of products, how many orders contained both.
+The top neighbours of each product are stored in RelatedProduct, so the
+detail page reads them with one indexed query.
+
+Counting is done one slice of product ids at a time: a pass streams every
+order line but only keeps counts for products in the slice, so memory is
+bounded by the slice size times the neighbours per product, however many
+order lines there are.
+"""
+
+import heapq
+from collections import Counter, defaultdict
+from itertools import groupby
+
+from django.db import transaction
+
+from .models import Product, RelatedProduct
+
+TOP_NEIGHBOURS = 8
+PARTITION_SIZE = 5000
+CHUNK_SIZE = 10000
+
+# Orders with more distinct products than this (bulk or wholesale orders)
+# say little about affinity and would add a quadratic number of pairs
+MAX_BASKET_SIZE = 50
+
+EXCLUDED_ORDER_STATUSES = ["cancelled", "refunded"]
+
+
+def stream_baskets(chunk_size=CHUNK_SIZE):
+    """Yield the set of product ids in each order"""
+    from orders.models import OrderItem
+
+    lines = (
+        OrderItem.objects.exclude(order__status__in=EXCLUDED_ORDER_STATUSES)
+        .order_by("order_id")
+        .values_list("order_id", "product_id")
+        .iterator(chunk_size=chunk_size)
+    )
+    for _, rows in groupby(lines, key=lambda row: row[0]):
+        basket = {product_id for _, product_id in rows}
+        if 1 < len(basket) <= MAX_BASKET_SIZE:
+            yield basket
+
+
+def count_co_purchases(low, high, chunk_size=CHUNK_SIZE):
+    """Co-purchase counts for products with low <= id < high
+
+    Returns {product_id: Counter({other_product_id: orders})}.
+    """
+    counts = defaultdict(Counter)
+    for basket in stream_baskets(chunk_size):
+        sources = [product_id for product_id in basket if low <= product_id < high]
+        for product_id in sources:
+            counts[product_id].update(basket)
+    for product_id, neighbours in counts.items():
+        del neighbours[product_id]
+    return counts
+
+
+def top_neighbours(neighbours, limit=TOP_NEIGHBOURS):
+    """Highest scoring neighbours, ties broken by product id"""
+    return heapq.nsmallest(
+        limit, neighbours.items(), key=lambda item: (-item[1], item[0])
+    )
+
+
+def compute_related_products(
+    top=TOP_NEIGHBOURS, partition_size=PARTITION_SIZE, chunk_size=CHUNK_SIZE
+):
+    """Rebuild the RelatedProduct table, returning the number of rows written"""
+    written = 0
+    low = 0
+    while True:
+        # Slice by existing ids rather than fixed ranges, so gaps left by
+        # deleted products don't cost empty passes over the order lines
+        ids = list(
+            Product.objects.filter(id__gte=low)
+            .order_by("id")
+            .values_list("id", flat=True)[:partition_size]
+        )
+        if not ids:
+            return written
+        low, high = ids[0], ids[-1] + 1
+        counts = count_co_purchases(low, high, chunk_size)
+        rows = [
+            RelatedProduct(
+                product_id=product_id, related_id=related_id, score=score, rank=rank
+            )
+            for product_id, neighbours in counts.items()
+            for rank, (related_id, score) in enumerate(top_neighbours(neighbours, top))
+        ]
+        with transaction.atomic():
+            RelatedProduct.objects.filter(
+                product_id__gte=low, product_id__lt=high
+            ).delete()
+            RelatedProduct.objects.bulk_create(rows, batch_size=1000)
+        written += len(rows)
+        low = high
+
+
+def related_products_for(product, limit=4):
+    """Co-purchased products, topped up with others from the same category"""
+    related = list(
+        Product.objects.filter(related_to__product=product, is_available=True).order_by(
+            "related_to__rank"
+        )[:limit]
+    )
+    if len(related) < limit:
+        exclude = [product.id] + [other.id for other in related]
+        related += Product.objects.filter(
+            category_id=product.category_id, is_available=True
+        ).exclude(id__in=exclude)[: limit - len(related)]
+    return related
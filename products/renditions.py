@@ -0,0 +1,132 @@
+"""
+Responsive image renditions
+
+Every uploaded catalog image (and user avatar) gets resized copies stored
+next to the original, one WebP and one JPEG per configured width:
+
+    products/ginger.png -> products/ginger_320w.webp, products/ginger_320w.jpg, ...
+
+Templates serve them through ``{% responsive_image %}`` (see
+products.templatetags.image_tags) as a <picture> with a WebP source and a
+JPEG fallback, so browsers download the smallest file that fits the layout
+instead of the full-size upload.
+
+Renditions are made when an image is saved and can be backfilled with the
+``generate_renditions`` management command.
+"""
+
+import logging
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+RENDITION_WIDTHS = getattr(settings, "IMAGE_RENDITION_WIDTHS", [320, 640, 960, 1280])
+
+RENDITION_FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+# Existence of the renditions is remembered so templates don't touch the
+# storage backend on every render; misses are rechecked after a while
+READY_TIMEOUT = None
+MISSING_TIMEOUT = 300
+
+
+def rendition_name(name, width, extension):
+    stem, _ = os.path.splitext(name)
+    return f"{stem}_{width}w.{extension}"
+
+
+def _ready_key(name):
+    return f"renditions:{name}"
+
+
+def _flatten(image):
+    """Convert to RGB, painting transparent areas white for JPEG"""
+    if image.mode in ("RGBA", "LA") or (
+        image.mode == "P" and "transparency" in image.info
+    ):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def generate_renditions(name, storage=None, force=False):
+    """Write every rendition of the image stored under ``name``
+
+    Widths larger than the original are still written, at the original
+    size, so templates can rely on the full set existing. Returns the number
+    of files written.
+    """
+    storage = storage or default_storage
+    written = 0
+    with storage.open(name, "rb") as source:
+        original = ImageOps.exif_transpose(Image.open(source))
+        original = _flatten(original)
+
+    for width in RENDITION_WIDTHS:
+        if original.width > width:
+            height = max(round(original.height * width / original.width), 1)
+            resized = original.resize((width, height), Image.LANCZOS)
+        else:
+            resized = original
+        for extension, (format, options) in RENDITION_FORMATS.items():
+            target = rendition_name(name, width, extension)
+            if storage.exists(target):
+                if not force:
+                    continue
+                storage.delete(target)
+            buffer = BytesIO()
+            resized.save(buffer, format, **options)
+            storage.save(target, ContentFile(buffer.getvalue()))
+            written += 1
+
+    cache.set(_ready_key(name), True, READY_TIMEOUT)
+    return written
+
+
+def has_renditions(fieldfile):
+    """Whether the renditions of an image file have been generated"""
+    ready = cache.get(_ready_key(fieldfile.name))
+    if ready is None:
+        last = rendition_name(fieldfile.name, RENDITION_WIDTHS[-1], "jpg")
+        ready = fieldfile.storage.exists(last)
+        cache.set(
+            _ready_key(fieldfile.name),
+            ready,
+            READY_TIMEOUT if ready else MISSING_TIMEOUT,
+        )
+    return ready
+
+
+def ensure_renditions(fieldfile):
+    """Generate renditions for a newly saved image if it has none yet
+
+    Uploads get a fresh file name, so this only does work when the image
+    itself changed, not on every save of the owning model.
+    """
+    if not fieldfile or cache.get(_ready_key(fieldfile.name)):
+        return
+    try:
+        generate_renditions(fieldfile.name, fieldfile.storage)
+    except (OSError, Image.DecompressionBombError) as e:
+        # A broken upload must not break the save; the template falls back
+        # to the original file
+        logger.warning("Could not generate renditions for %s: %s", fieldfile.name, e)
+
+
+def srcset(fieldfile, extension):
+    return ", ".join(
+        f"{fieldfile.storage.url(rendition_name(fieldfile.name, width, extension))} {width}w"
+        for width in RENDITION_WIDTHS
+    )
@@ -0,0 +1,244 @@
+"""
+Full-text product search
+
+Each supported database engine gets its own backend:
+
+- SQLite: an FTS5 virtual table kept in sync from Product signals
+- PostgreSQL: a GIN index over a weighted tsvector expression
+- MySQL: a FULLTEXT index on the searchable columns
+
+PostgreSQL and MySQL maintain their indexes themselves, so only the SQLite
+backend needs incremental updates. If the engine can't do full-text search
+(e.g. SQLite built without FTS5) the old icontains lookup is used instead.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_FIELDS = ["name", "short_description", "description"]
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def search_terms(query):
+    """Split a raw search string into plain word tokens"""
+    return _WORD_RE.findall(query or "")[:10]
+
+
+class IcontainsSearchBackend:
+    """Fallback backend using LIKE lookups (no ranking, no index)"""
+
+    def install(self, cursor):
+        pass
+
+    def uninstall(self, cursor):
+        pass
+
+    def rebuild(self):
+        return 0
+
+    def index_product(self, product):
+        pass
+
+    def remove_product(self, product_id):
+        pass
+
+    def search(self, queryset, query):
+        condition = Q()
+        for field in SEARCH_FIELDS:
+            condition |= Q(**{f"{field}__icontains": query})
+        return queryset.filter(condition).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+
+
+class FullTextSearchBackend(IcontainsSearchBackend):
+    """Base class for backends that filter and rank with raw SQL"""
+
+    match_sql = None
+    rank_sql = None
+
+    def build_query(self, terms):
+        raise NotImplementedError
+
+    def no_results(self, queryset):
+        # A query with no words matches nothing, but callers still sort by rank
+        return queryset.none().annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+
+    def search(self, queryset, query):
+        terms = search_terms(query)
+        if not terms:
+            return self.no_results(queryset)
+        match = self.build_query(terms)
+        return queryset.filter(
+            RawSQL(self.match_sql, [match], output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(self.rank_sql, [match], output_field=FloatField())
+        )
+
+
+class SQLiteSearchBackend(FullTextSearchBackend):
+    table = "products_product_fts"
+
+    def search(self, queryset, query):
+        terms = search_terms(query)
+        if not terms:
+            return self.no_results(queryset)
+        # Join the FTS table directly: a correlated bm25() subquery re-runs
+        # the full-text query for every matching row and is far too slow
+        return queryset.extra(
+            tables=[self.table],
+            where=[
+                f"{self.table}.rowid = products_product.id",
+                f"{self.table} MATCH %s",
+            ],
+            params=[self.build_query(terms)],
+            # bm25() is lower-is-better, negate it so every backend sorts
+            # descending. Column weights: name, short_description, description
+            select={"search_rank": f"-bm25({self.table}, 10.0, 4.0, 1.0)"},
+        )
+
+    @staticmethod
+    def is_supported():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            return bool(cursor.fetchone()[0])
+
+    def build_query(self, terms):
+        # Quote every term so FTS5 operators in user input are inert, and
+        # allow prefix matches so partially typed words still hit
+        return " ".join('"{}"*'.format(term.replace('"', "")) for term in terms)
+
+    def install(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} "
+            "USING fts5(name, short_description, description, "
+            "tokenize='porter unicode61')"
+        )
+        self._populate(cursor)
+
+    def uninstall(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def _populate(self, cursor):
+        cursor.execute(f"DELETE FROM {self.table}")
+        cursor.execute(
+            f"INSERT INTO {self.table} (rowid, name, short_description, description) "
+            "SELECT id, name, short_description, description FROM products_product"
+        )
+        return cursor.rowcount
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            count = self._populate(cursor)
+            cursor.execute(
+                f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')"
+            )
+        return count
+
+    def index_product(self, product):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [product.pk])
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, name, short_description, description) "
+                "VALUES (%s, %s, %s, %s)",
+                [
+                    product.pk,
+                    product.name,
+                    product.short_description,
+                    product.description,
+                ],
+            )
+
+    def remove_product(self, product_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [product_id])
+
+
+class PostgreSQLSearchBackend(FullTextSearchBackend):
+    index = "products_product_search_idx"
+
+    # The match/rank expressions must stay identical to the indexed one,
+    # otherwise the planner can't use the GIN index
+    vector_sql = (
+        "(setweight(to_tsvector('english', coalesce(products_product.name, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(products_product.short_description, '')), 'B') || "
+        "setweight(to_tsvector('english', coalesce(products_product.description, '')), 'C'))"
+    )
+    match_sql = vector_sql + " @@ to_tsquery('english', %s)"
+    rank_sql = "ts_rank(" + vector_sql + ", to_tsquery('english', %s))"
+
+    def build_query(self, terms):
+        return " & ".join(f"{term}:*" for term in terms)
+
+    def install(self, cursor):
+        index_expr = self.vector_sql.replace("products_product.", "")
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.index} ON products_product "
+            f"USING GIN ({index_expr})"
+        )
+
+    def uninstall(self, cursor):
+        cursor.execute(f"DROP INDEX IF EXISTS {self.index}")
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"REINDEX INDEX {self.index}")
+            cursor.execute("SELECT COUNT(*) FROM products_product")
+            return cursor.fetchone()[0]
+
+
+class MySQLSearchBackend(FullTextSearchBackend):
+    index = "products_product_fulltext"
+
+    columns = ", ".join(f"products_product.{field}" for field in SEARCH_FIELDS)
+    match_sql = f"MATCH ({columns}) AGAINST (%s IN BOOLEAN MODE)"
+    rank_sql = match_sql
+
+    def build_query(self, terms):
+        # Boolean mode: every term required, prefix match on each
+        return " ".join(f"+{term}*" for term in terms)
+
+    def install(self, cursor):
+        cursor.execute(
+            f"ALTER TABLE products_product ADD FULLTEXT INDEX {self.index} "
+            f"({', '.join(SEARCH_FIELDS)})"
+        )
+
+    def uninstall(self, cursor):
+        cursor.execute(f"ALTER TABLE products_product DROP INDEX {self.index}")
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute("OPTIMIZE TABLE products_product")
+            cursor.fetchall()
+            cursor.execute("SELECT COUNT(*) FROM products_product")
+            return cursor.fetchone()[0]
+
+
+_backend = None
+
+
+def get_search_backend():
+    """Return the search backend for the default database"""
+    global _backend
+    if _backend is None:
+        if connection.vendor == "sqlite" and SQLiteSearchBackend.is_supported():
+            _backend = SQLiteSearchBackend()
+        elif connection.vendor == "postgresql":
+            _backend = PostgreSQLSearchBackend()
+        elif connection.vendor == "mysql":
+            _backend = MySQLSearchBackend()
+        else:
+            _backend = IcontainsSearchBackend()
+    return _backend
+
+
+def search_products(queryset, query):
+    """Filter a Product queryset by a search string, annotated with search_rank"""
+    return get_search_backend().search(queryset, query)
@@ -0,0 +1,53 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import bump_catalog_version
+from .models import Category, Product, ProductImage, ProductReview
+from .ratings import refresh_product_ratings
+from .renditions import ensure_renditions
+from .search import get_search_backend
+
+
+@receiver(post_save, sender=Product)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    """Keep the full-text index in step with product edits"""
+    if raw:
+        return
+    get_search_backend().index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_search_index(sender, instance, **kwargs):
+    """Drop deleted products from the full-text index"""
+    get_search_backend().remove_product(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_catalog_cache(sender, **kwargs):
+    """Orphan every cached page fragment, count and autocomplete index"""
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=ProductReview)
+def update_product_ratings(sender, instance, raw=False, **kwargs):
+    """Recompute the rating aggregates of the reviewed product"""
+    if raw:
+        return
+    refresh_product_ratings([instance.product_id])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=ProductImage)
+def create_image_renditions(sender, instance, raw=False, **kwargs):
+    """Resize newly uploaded images once the save is committed"""
+    if raw or not instance.image:
+        return
+    transaction.on_commit(lambda: ensure_renditions(instance.image))
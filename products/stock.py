@@ -0,0 +1,148 @@
+"""
+Sharded stock for flash sales
+
+Checkout takes stock with a conditional UPDATE on the product row, so
+during a promotion every buyer of the same product queues on that one row
+lock. Sharding a product splits its stock across STOCK_SHARDS StockShard
+rows. A buyer takes units from a random shard, so concurrent buyers
+mostly lock different rows. When the chosen shard runs short, all the
+shards are locked in shard order and the units borrowed from them. The
+borrower still holds the lock of the shard it tried first, so two
+borrowers can deadlock; checkout retries once when the database breaks
+one (see orders.placement).
+
+While a product is sharded, the shards hold its stock and
+Product.stock_quantity is a copy of their total that fold_stock() (run by
+the fold_stock_shards command) refreshes every few seconds. Listing
+filters, the cart and the admin read that copy. The detail page reads
+available_stock(), a briefly cached total. unshard_stock() folds the
+shards back into the product row once the sale is over.
+"""
+
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .models import Product, StockShard
+
+STOCK_SHARDS = getattr(settings, "STOCK_SHARDS", 8)
+
+# How stale the shard total shown on product pages may be
+AVAILABLE_STOCK_TIMEOUT = getattr(settings, "STOCK_SHARD_CACHE_TIMEOUT", 5)
+
+
+def _available_key(product_id):
+    return f"stock:available:{product_id}"
+
+
+def shard_stock(product, shards=STOCK_SHARDS):
+    """Split the product's stock evenly across ``shards`` counter rows"""
+    with transaction.atomic():
+        unshard_stock(product)
+        product = Product.objects.select_for_update().get(pk=product.pk)
+        share, extra = divmod(product.stock_quantity, shards)
+        StockShard.objects.bulk_create(
+            [
+                StockShard(
+                    product=product, shard=shard, quantity=share + (shard < extra)
+                )
+                for shard in range(shards)
+            ]
+        )
+        Product.objects.filter(pk=product.pk).update(stock_shards=shards)
+    cache.delete(_available_key(product.pk))
+
+
+def unshard_stock(product):
+    """Move the shards' stock back into Product.stock_quantity"""
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(pk=product.pk)
+        if not product.stock_shards:
+            return
+        # Lock the shards so no take lands between the sum and the delete
+        quantities = StockShard.objects.select_for_update().filter(product=product)
+        total = sum(quantities.values_list("quantity", flat=True))
+        quantities.delete()
+        Product.objects.filter(pk=product.pk).update(
+            stock_quantity=total, stock_shards=0, updated_at=timezone.now()
+        )
+    cache.delete(_available_key(product.pk))
+
+
+def take_sharded_stock(product, quantity):
+    """Take ``quantity`` units from a sharded product's shards
+
+    Returns False, taking nothing, when the shards don't hold enough. Must
+    run inside a transaction, which keeps the shards locked until it ends.
+    """
+    shards = StockShard.objects.filter(product_id=product.pk)
+    start = random.randrange(product.stock_shards)
+    if shards.filter(shard=start, quantity__gte=quantity).update(
+        quantity=F("quantity") - quantity
+    ):
+        return True
+
+    # Borrow from whichever shards have units, after locking them all with
+    # one statement in shard order
+    available = list(
+        shards.select_for_update().order_by("shard").values_list("shard", "quantity")
+    )
+    if sum(units for _, units in available) < quantity:
+        return False
+    needed = quantity
+    for shard, units in available:
+        take = min(units, needed)
+        if take:
+            shards.filter(shard=shard).update(quantity=F("quantity") - take)
+            needed -= take
+    return True
+
+
+def sharded_totals(product_ids):
+    """{product id: units left} for the sharded products among ``product_ids``"""
+    return dict(
+        StockShard.objects.filter(product_id__in=product_ids)
+        .values("product_id")
+        .annotate(total=Sum("quantity"))
+        .values_list("product_id", "total")
+    )
+
+
+def available_stock(product):
+    key = _available_key(product.pk)
+    total = cache.get(key)
+    if total is None:
+        total = sharded_totals([product.pk]).get(product.pk, 0)
+        cache.set(key, total, AVAILABLE_STOCK_TIMEOUT)
+    return total
+
+
+def fold_stock():
+    """Copy each sharded product's shard total into its stock_quantity
+
+    Returns how many products changed. The catalog version is bumped when
+    a product sells out or comes back, so cached listings follow.
+    """
+    copies = dict(
+        Product.objects.filter(stock_shards__gt=0).values_list("id", "stock_quantity")
+    )
+    totals = sharded_totals(list(copies))
+    changed = 0
+    crossed_zero = False
+    now = timezone.now()
+    for product_id, copy in copies.items():
+        total = totals.get(product_id, 0)
+        if total == copy:
+            continue
+        changed += Product.objects.filter(id=product_id, stock_shards__gt=0).update(
+            stock_quantity=total, updated_at=now
+        )
+        crossed_zero = crossed_zero or (total == 0) != (copy == 0)
+    if crossed_zero:
+        bump_catalog_version()
+    return changed
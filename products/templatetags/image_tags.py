@@ -0,0 +1,32 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from products.renditions import RENDITION_WIDTHS, has_renditions, rendition_name, srcset
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image, alt="", sizes="100vw", **attrs):
+    """
+    Render an image as a <picture> with WebP and JPEG renditions.
+    Usage: {% responsive_image product.image alt=product.name sizes="33vw" class="card-img-top" %}
+    Until the renditions exist the original file is used as a plain <img>.
+    """
+    attrs.setdefault("loading", "lazy")
+    if not has_renditions(image):
+        return format_html('<img src="{}" alt="{}"{}>', image.url, alt, flatatt(attrs))
+
+    fallback = image.storage.url(rendition_name(image.name, RENDITION_WIDTHS[0], "jpg"))
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}"{}></picture>',
+        srcset(image, "webp"),
+        sizes,
+        fallback,
+        srcset(image, "jpg"),
+        sizes,
+        alt,
+        flatatt(attrs),
+    )
@@ -0,0 +1,161 @@
+import json
+import re
+import uuid
+from unittest import mock
+
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from orders.models import Cart, Order, OrderTracking
+from products.models import Category, Product, StockShard
+from products.stock import shard_stock, take_sharded_stock
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Herbs", slug="herbs")
+        Product.objects.create(
+            name="Moringa",
+            slug="moringa",
+            description="Moringa leaf powder",
+            category=category,
+            price=1000,
+            stock_quantity=10,
+            image="",
+        )
+
+    def search(self, query):
+        return self.client.get(reverse("products:product_list"), {"search": query})
+
+    def test_matches(self):
+        response = self.search("moringa")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [product.slug for product in response.context["page_obj"]], ["moringa"]
+        )
+
+    def test_punctuation_only(self):
+        # These reduce to no search terms at all
+        for query in ["+++", "   ", "!?.", '"*"']:
+            with self.subTest(query=query):
+                response = self.search(query)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(list(response.context["page_obj"]), [])
+
+
+def plan_problems(queryset):
+    """Return (plan text, list of problems) for a queryset on this database"""
+    table = queryset.model._meta.db_table
+    vendor = connection.vendor
+    problems = []
+
+    if vendor == "mysql":
+        plan = queryset.explain(format="json")
+        data = json.loads(plan)
+        if re.search(r'"access_type":\s*"ALL"', plan):
+            problems.append("full table scan")
+        if '"using_filesort": true' in json.dumps(data):
+            problems.append("sort not served by an index")
+        return plan, problems
+
+    if vendor == "postgresql":
+        # Tiny test tables make a sequential scan the cheapest plan, so ask
+        # whether an index *can* serve the query
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = queryset.explain()
+        if f"Seq Scan on {table}" in plan:
+            problems.append("full table scan")
+        if re.search(r"^\s*(->\s*)?Sort\b", plan, re.MULTILINE):
+            problems.append("sort not served by an index")
+        return plan, problems
+
+    plan = queryset.explain()
+    if re.search(rf"SCAN {table}(?! USING)", plan):
+        problems.append("full table scan")
+    if "USE TEMP B-TREE FOR ORDER BY" in plan:
+        problems.append("sort not served by an index")
+    return plan, problems
+
+
+class QueryPlanTests(TestCase):
+    """The queries every listing or cart request runs are served by indexes"""
+
+    def assert_indexed(self, queryset):
+        plan, problems = plan_problems(queryset)
+        self.assertEqual(problems, [], plan)
+
+    def test_product_list(self):
+        available = Product.objects.filter(is_available=True)
+        for ordering in [("-created_at", "-id"), ("price", "id"), ("name", "id")]:
+            with self.subTest(ordering=ordering):
+                self.assert_indexed(available.order_by(*ordering)[:13])
+
+    def test_category_page(self):
+        available = Product.objects.filter(is_available=True, category_id=1)
+        for ordering in [("-created_at", "-id"), ("price", "id"), ("name", "id")]:
+            with self.subTest(ordering=ordering):
+                self.assert_indexed(available.order_by(*ordering)[:13])
+
+    def test_featured(self):
+        self.assert_indexed(
+            Product.objects.filter(is_available=True, is_featured=True)[:8]
+        )
+
+    def test_cart_by_session(self):
+        self.assert_indexed(Cart.objects.filter(session_key="x" * 32))
+
+    def test_recent_orders(self):
+        self.assert_indexed(Order.objects.filter(user_id=1).order_by("-created_at")[:5])
+
+    def test_order_tracking(self):
+        self.assert_indexed(
+            OrderTracking.objects.filter(order_id=uuid.uuid4()).order_by("-created_at")
+        )
+
+
+class ShardedStockTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Herbs", slug="herbs")
+        cls.product = Product.objects.create(
+            name="Moringa",
+            slug="moringa",
+            description="Moringa leaf powder",
+            category=category,
+            price=1000,
+            stock_quantity=10,
+            image="",
+        )
+
+    def setUp(self):
+        shard_stock(self.product, shards=4)
+        self.product.refresh_from_db()
+
+    def shards(self):
+        return list(
+            StockShard.objects.filter(product=self.product)
+            .order_by("shard")
+            .values_list("quantity", flat=True)
+        )
+
+    def take(self, quantity, start=0):
+        with mock.patch("products.stock.random.randrange", return_value=start):
+            return take_sharded_stock(self.product, quantity)
+
+    def test_takes_from_the_chosen_shard(self):
+        self.assertEqual(self.shards(), [3, 3, 2, 2])
+        self.assertTrue(self.take(2, start=2))
+        self.assertEqual(self.shards(), [3, 3, 0, 2])
+
+    def test_borrows_across_shards(self):
+        self.assertTrue(self.take(7, start=3))
+        self.assertEqual(self.shards(), [0, 0, 1, 2])
+
+    def test_short_takes_nothing(self):
+        self.assertFalse(self.take(11))
+        self.assertEqual(self.shards(), [3, 3, 2, 2])
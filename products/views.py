@@ -1,11 +1,16 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator
-from django.db.models import Q, Avg
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.core.cache import cache
+from django.http import Http404, JsonResponse
 from .models import Product, Category, ProductReview
 from .forms import ProductReviewForm
+from .search import search_products
+from .pagination import KEYSET_SORTS, paginate_products
+from .facets import apply_filters, get_facets, normalize_filters
+from . import autocomplete
+from .cache import CATALOG_CACHE_TIMEOUT, catalog_cache_key, get_catalog_version
+from .recommendations import related_products_for
 
 
 def home(request):
@@ -13,9 +18,12 @@ def home(request):
     featured_products = Product.objects.filter(is_featured=True, is_available=True)[:8]
     categories = Category.objects.filter(is_active=True)[:6]
 
+    # Both querysets stay lazy; they only run when the cached fragments
+    # for the current catalog version are missing
     context = {
         "featured_products": featured_products,
         "categories": categories,
+        "catalog_version": get_catalog_version(),
     }
     return render(request, "products/home.html", context)
 
@@ -25,42 +33,42 @@ def product_list(request):
     products = Product.objects.filter(is_available=True)
     categories = Category.objects.filter(is_active=True)
 
+    filters = normalize_filters(request.GET)
+
     # Search functionality
     search_query = request.GET.get("search")
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query)
-            | Q(description__icontains=search_query)
-            | Q(short_description__icontains=search_query)
-        )
+        products = search_products(products, search_query)
 
-    # Category filtering
-    category_slug = request.GET.get("category")
-    if category_slug:
-        products = products.filter(category__slug=category_slug)
+    # Facet counts ignore the remaining filters' own dimension, so they are
+    # computed from the search results before filtering
+    facets = get_facets(products, filters)
 
-    # Price filtering
-    min_price = request.GET.get("min_price")
-    max_price = request.GET.get("max_price")
-    if min_price:
-        products = products.filter(price__gte=min_price)
-    if max_price:
-        products = products.filter(price__lte=max_price)
+    # Category, price, stock and sale filtering
+    category_slug = filters["category"]
+    products = apply_filters(products, filters)
 
-    # Sorting
-    sort_by = request.GET.get("sort", "-created_at")
-    if sort_by in ["name", "-name", "price", "-price", "created_at", "-created_at"]:
+    # Sorting (search results default to best match first)
+    sort_by = request.GET.get("sort", "relevance" if search_query else "-created_at")
+    if sort_by == "relevance" and search_query:
+        products = products.order_by("-search_rank", "-created_at")
+    elif sort_by in KEYSET_SORTS:
+        products = products.order_by(sort_by)
+    else:
+        sort_by = "-created_at"
         products = products.order_by(sort_by)
 
     # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate_products(request, products, sort_by)
 
     categories_with_selection = []
     for category in categories:
         categories_with_selection.append(
-            {"category": category, "is_selected": category.slug == category_slug}
+            {
+                "category": category,
+                "is_selected": category.slug == category_slug,
+                "count": facets["categories"].get(category.id, 0),
+            }
         )
 
     context = {
@@ -69,6 +77,9 @@ def product_list(request):
         "search_query": search_query,
         "selected_category": category_slug,
         "sort_by": sort_by,
+        "filters": filters,
+        "facets": facets,
+        "catalog_version": get_catalog_version(),
     }
     return render(request, "products/product_list.html", context)
 
@@ -76,13 +87,11 @@ def product_list(request):
 def product_detail(request, slug):
     """Product detail page"""
     product = get_object_or_404(Product, slug=slug, is_available=True)
-    related_products = Product.objects.filter(
-        category=product.category, is_available=True
-    ).exclude(id=product.id)[:4]
+    related_products = related_products_for(product)
 
     # Reviews
-    reviews = product.reviews.filter(is_approved=True)
-    avg_rating = reviews.aggregate(Avg("rating"))["rating__avg"]
+    reviews = product.reviews.filter(is_approved=True).select_related("user")
+    avg_rating = product.avg_rating if product.review_count else None
     review_form = ProductReviewForm()
 
     # Check if user has already reviewed this product
@@ -103,23 +112,29 @@ def product_detail(request, slug):
 
 def category_detail(request, slug):
     """Category detail page with products"""
-    category = get_object_or_404(Category, slug=slug, is_active=True)
+    category = cache.get_or_set(
+        catalog_cache_key("category", slug),
+        lambda: Category.objects.filter(slug=slug, is_active=True).first(),
+        CATALOG_CACHE_TIMEOUT,
+    )
+    if category is None:
+        raise Http404("No Category matches the given query.")
     products = Product.objects.filter(category=category, is_available=True)
 
     # Sorting
     sort_by = request.GET.get("sort", "-created_at")
-    if sort_by in ["name", "-name", "price", "-price", "created_at", "-created_at"]:
-        products = products.order_by(sort_by)
+    if sort_by not in KEYSET_SORTS:
+        sort_by = "-created_at"
+    products = products.order_by(sort_by)
 
     # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate_products(request, products, sort_by)
 
     context = {
         "category": category,
         "page_obj": page_obj,
         "sort_by": sort_by,
+        "catalog_version": get_catalog_version(),
     }
     return render(request, "products/category_detail.html", context)
 
@@ -157,20 +172,7 @@ def search_suggestions(request):
     suggestions = []
 
     if len(query) >= 2:
-        products = Product.objects.filter(
-            Q(name__icontains=query) | Q(short_description__icontains=query),
-            is_available=True,
-        )[:10]
-
-        suggestions = [
-            {
-                "name": product.name,
-                "url": product.get_absolute_url(),
-                "price": str(product.price),
-                "image": product.image.url if product.image else "",
-            }
-            for product in products
-        ]
+        suggestions = autocomplete.suggest(query)
 
     return JsonResponse({"suggestions": suggestions})
 
@@ -3,7 +3,7 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
 from django.utils.html import format_html
 from django.urls import reverse
-from .models import UserProfile, Address
+from .models import UserProfile, Address, NewsletterCampaign
 
 
 class UserProfileInline(admin.StackedInline):
@@ -212,3 +212,44 @@ class AddressAdmin(admin.ModelAdmin):
             return format_html('<span style="color: gray;">○ Regular</span>')
 
     default_status.short_description = "Default"
+
+
+@admin.register(NewsletterCampaign)
+class NewsletterCampaignAdmin(admin.ModelAdmin):
+    list_display = ["subject", "status", "progress", "created_at", "finished_at"]
+    list_filter = ["status", "created_at"]
+    search_fields = ["subject"]
+    readonly_fields = [
+        "status",
+        "last_user_id",
+        "sent_count",
+        "failed_count",
+        "created_at",
+        "started_at",
+        "finished_at",
+    ]
+
+    fieldsets = (
+        ("Campaign", {"fields": ("subject", "body")}),
+        (
+            "Progress",
+            {
+                "fields": (
+                    "status",
+                    "sent_count",
+                    "failed_count",
+                    "last_user_id",
+                    "started_at",
+                    "finished_at",
+                ),
+                "description": "Send with: python manage.py send_campaign <id>",
+            },
+        ),
+    )
+
+    def progress(self, obj):
+        return format_html(
+            "{} sent<br><small>{} failed</small>", obj.sent_count, obj.failed_count
+        )
+
+    progress.short_description = "Progress"
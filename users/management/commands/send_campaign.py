@@ -0,0 +1,86 @@
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+from jigsimurherbal.render_pool import RENDER_PROCESSES
+from users.models import NewsletterCampaign
+from users.newsletter import BATCH_SIZE, CHUNK_SIZE, send_campaign
+
+
+class Command(BaseCommand):
+    help = "Mail a newsletter campaign to every subscriber, resuming where it stopped"
+
+    def add_arguments(self, parser):
+        parser.add_argument("campaign_id", type=int)
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=0,
+            help="Maximum messages per second (default: no limit)",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=RENDER_PROCESSES,
+            help="Worker processes rendering the messages (default: "
+            "EMAIL_RENDER_PROCESSES, 0 renders in this process)",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Start again from the first subscriber instead of resuming",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            campaign = NewsletterCampaign.objects.get(pk=options["campaign_id"])
+        except NewsletterCampaign.DoesNotExist:
+            raise CommandError(f"No campaign with id {options['campaign_id']}.")
+
+        if options["restart"]:
+            NewsletterCampaign.objects.filter(pk=campaign.pk).update(
+                last_user_id=0, sent_count=0, failed_count=0, finished_at=None
+            )
+            campaign.refresh_from_db()
+        elif campaign.status == "sent":
+            raise CommandError(
+                "This campaign was already sent, use --restart to resend."
+            )
+        elif campaign.last_user_id:
+            self.stdout.write(
+                f"Resuming after user {campaign.last_user_id} "
+                f"({campaign.sent_count} already sent)"
+            )
+
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        campaign = send_campaign(
+            campaign,
+            batch_size=options["batch_size"],
+            chunk_size=options["chunk_size"],
+            rate=options["rate"],
+            should_stop=lambda: self.stopping,
+            progress=self.report,
+            processes=options["processes"],
+        )
+        message = (
+            f"Campaign {campaign.status}: {campaign.sent_count} sent, "
+            f"{campaign.failed_count} failed."
+        )
+        if campaign.status == "paused":
+            self.stdout.write(self.style.WARNING(message + " Run again to resume."))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
+
+    def report(self, campaign):
+        self.stdout.write(
+            f"  {campaign.sent_count} sent, {campaign.failed_count} failed, "
+            f"up to user {campaign.last_user_id}"
+        )
+
+    def stop(self, signum, frame):
+        # Finish and checkpoint the current batch, then exit
+        self.stopping = True
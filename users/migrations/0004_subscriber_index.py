@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0003_newsletter_campaign"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="userprofile",
+            name="profile_subscriber_idx",
+        ),
+        migrations.AddIndex(
+            model_name="userprofile",
+            index=models.Index(
+                fields=["newsletter_subscription", "user"],
+                name="profile_subscriber_idx",
+            ),
+        ),
+    ]
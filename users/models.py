@@ -1,9 +1,7 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
 from django.conf import settings
 
 
@@ -17,6 +15,16 @@ class UserProfile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Newsletter campaigns walk the subscribers in user id order. Not a
+        # partial index, MySQL doesn't have those
+        indexes = [
+            models.Index(
+                fields=["newsletter_subscription", "user"],
+                name="profile_subscriber_idx",
+            )
+        ]
+
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
@@ -62,6 +70,39 @@ class Address(models.Model):
         super().save(*args, **kwargs)
 
 
+class NewsletterCampaign(models.Model):
+    """A newsletter mailed to every subscriber by the send_campaign command"""
+
+    STATUS_CHOICES = [
+        ("draft", "Draft"),
+        ("sending", "Sending"),
+        ("paused", "Paused"),
+        ("sent", "Sent"),
+    ]
+
+    subject = models.CharField(max_length=200)
+    # Django template markup, rendered for each subscriber with ``user``
+    body = models.TextField(
+        help_text="HTML content. {{ user.first_name }} and other user fields can be used."
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="draft")
+
+    # Progress, saved after every batch so an interrupted run can resume
+    last_user_id = models.PositiveIntegerField(default=0, editable=False)
+    sent_count = models.PositiveIntegerField(default=0, editable=False)
+    failed_count = models.PositiveIntegerField(default=0, editable=False)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True, editable=False)
+    finished_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return self.subject
+
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     """Create user profile when user is created"""
@@ -80,17 +121,28 @@ def save_user_profile(sender, instance, **kwargs):
         UserProfile.objects.create(user=instance)
 
 
+@receiver(post_save, sender=UserProfile)
+def create_avatar_renditions(sender, instance, raw=False, **kwargs):
+    """Resize a newly uploaded avatar once the save is committed"""
+    if raw or not instance.avatar:
+        return
+    from products.renditions import ensure_renditions
+
+    transaction.on_commit(lambda: ensure_renditions(instance.avatar))
+
+
 def send_welcome_email(user):
     """Send welcome email to newly registered user"""
     try:
         # Import here to avoid circular imports
+        from jigsimurherbal.email_render import render_email
         from jigsimurherbal.email_utils import EmailService
 
         # Build website URL - handle case where request is not available
         website_url = getattr(settings, "SITE_URL", "https://jigsimurherbalwonders.com")
 
-        # Render HTML email template
-        html_message = render_to_string(
+        # Render HTML email template and its plain text version
+        html_message, plain_message = render_email(
             "emails/newsletter/welcome.html",
             {
                 "user": user,
@@ -98,9 +150,6 @@ def send_welcome_email(user):
             },
         )
 
-        # Create plain text version
-        plain_message = strip_tags(html_message)
-
         # Send welcome email using newsletter service
         EmailService.send_newsletter_email(
             subject=f"Welcome to JigsimurHerbal, {user.first_name or user.username}! 🌿",
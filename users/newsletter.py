@@ -0,0 +1,276 @@
+"""
+Newsletter campaigns
+
+send_campaign() mails a NewsletterCampaign to every subscribed user
+(UserProfile.newsletter_subscription). Subscribers are streamed in user id
+order with .iterator(), so memory stays flat however many there are. The
+campaign body and the email layout are compiled once and rendered per
+subscriber with the CSS already inlined (see jigsimurherbal.email_render),
+and the messages go out in batches over pooled connections
+(see jigsimurherbal.mail_pool), paced to a maximum rate.
+
+After every batch the last user id reached and the counts are saved on
+the campaign, so an interrupted run resumes after the last finished
+batch. Only the batch that was in flight can be sent twice. If the mail
+server goes away the run pauses instead, at the first user it didn't
+reach, so resuming retries those users.
+
+With ``processes`` (EMAIL_RENDER_PROCESSES by default) the rendering is
+spread over a RenderPool: workers get batches of subscriber ids and send
+back the rendered messages, and the next batches render while this one
+is being sent.
+"""
+
+import logging
+import time
+from functools import partial
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db.models import F
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+from jigsimurherbal.email_render import (
+    email_from_string,
+    get_email_template,
+    html_to_text,
+)
+from jigsimurherbal.mail_pool import get_connection_pool, is_rejection
+from jigsimurherbal.render_pool import RENDER_PROCESSES, RenderPool
+
+from .models import NewsletterCampaign, UserProfile
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_TEMPLATE = "emails/newsletter/campaign.html"
+CHUNK_SIZE = 2000
+BATCH_SIZE = 100
+
+
+def _subscribed(**filters):
+    return (
+        UserProfile.objects.filter(
+            newsletter_subscription=True, user__is_active=True, **filters
+        )
+        .exclude(user__email="")
+        .order_by("user_id")
+    )
+
+
+def subscriber_ids(after_user_id=0, chunk_size=CHUNK_SIZE):
+    """Stream the ids of subscribed users after ``after_user_id``"""
+    return (
+        _subscribed(user_id__gt=after_user_id)
+        .values_list("user_id", flat=True)
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def subscribers(after_user_id=0, chunk_size=CHUNK_SIZE, user_ids=None):
+    """Stream subscribed users after ``after_user_id`` as lightweight objects
+
+    ``user_ids`` limits them to those users.
+    """
+    filters = {"user_id__gt": after_user_id}
+    if user_ids is not None:
+        filters["user_id__in"] = user_ids
+    rows = (
+        _subscribed(**filters)
+        .values_list("user_id", "user__email", "user__first_name", "user__last_name")
+        .iterator(chunk_size=chunk_size)
+    )
+    for user_id, email, first_name, last_name in rows:
+        yield SimpleNamespace(
+            id=user_id, email=email, first_name=first_name, last_name=last_name
+        )
+
+
+class CampaignRenderer:
+    """The campaign's templates, compiled once for the whole run"""
+
+    def __init__(self, campaign):
+        self.campaign = campaign
+        # The body is styled like the layout it is rendered into
+        self.body = email_from_string(campaign.body, LAYOUT_TEMPLATE)
+        self.layout = get_email_template(LAYOUT_TEMPLATE)
+        self.from_email = settings.DEFAULT_FROM_EMAIL
+        self.website_url = getattr(settings, "SITE_URL", "")
+
+    def render_parts(self, user):
+        """The (html, plain text) of the user's message"""
+        context = {
+            "user": user,
+            "campaign": self.campaign,
+            "website_url": self.website_url,
+        }
+        context["content"] = mark_safe(self.body.render(context))
+        html = self.layout.render(context)
+        return html, html_to_text(html)
+
+    def message(self, email, html, text):
+        message = EmailMultiAlternatives(
+            subject=self.campaign.subject,
+            body=text,
+            from_email=self.from_email,
+            to=[email],
+        )
+        message.attach_alternative(html, "text/html")
+        return message
+
+    def render(self, user):
+        return self.message(user.email, *self.render_parts(user))
+
+
+# Renderers of the campaigns a RenderPool worker has rendered, by id
+_renderers = {}
+
+
+def render_chunk(campaign_id, user_ids):
+    """Render a campaign for some of its subscribers in a RenderPool worker
+
+    Returns (user id, email, html, text) for each of ``user_ids`` that is
+    still subscribed.
+    """
+    if campaign_id not in _renderers:
+        _renderers[campaign_id] = CampaignRenderer(
+            NewsletterCampaign.objects.get(pk=campaign_id)
+        )
+    renderer = _renderers[campaign_id]
+    return [
+        (user.id, user.email, *renderer.render_parts(user))
+        for user in subscribers(user_ids=user_ids)
+    ]
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _render_batches(renderer, after_user_id, batch_size, chunk_size):
+    """Yield (last user id, users, messages) for each batch of subscribers"""
+    for users in batched(subscribers(after_user_id, chunk_size), batch_size):
+        yield users[-1].id, users, [renderer.render(user) for user in users]
+
+
+def _render_batches_in_processes(
+    renderer, after_user_id, batch_size, chunk_size, processes
+):
+    """_render_batches(), with the rendering done by a RenderPool"""
+    ids = batched(subscriber_ids(after_user_id, chunk_size), batch_size)
+    with RenderPool(processes) as render_pool:
+        render = partial(render_chunk, renderer.campaign.pk)
+        for user_ids, rendered in render_pool.map(render, ids):
+            users = [
+                SimpleNamespace(id=user_id, email=email)
+                for user_id, email, _, _ in rendered
+            ]
+            messages = [
+                renderer.message(email, html, text) for _, email, html, text in rendered
+            ]
+            # Users who unsubscribed meanwhile are skipped, not revisited
+            yield user_ids[-1], users, messages
+
+
+def send_campaign(
+    campaign,
+    batch_size=BATCH_SIZE,
+    chunk_size=CHUNK_SIZE,
+    rate=0,
+    should_stop=lambda: False,
+    progress=lambda campaign: None,
+    processes=RENDER_PROCESSES,
+):
+    """Mail ``campaign`` to the subscribers it hasn't reached yet
+
+    ``rate`` caps the messages per second (0 for no limit). The run stops
+    after the current batch once ``should_stop()`` is true, leaving the
+    campaign paused. It also pauses when the mail server can't be reached,
+    checkpointed before the first user it missed; only messages the server
+    rejected count as failed. ``processes`` renders in that many worker processes
+    (0 to render here). Returns the campaign with its progress refreshed.
+    """
+    renderer = CampaignRenderer(campaign)
+    pool = get_connection_pool()
+    NewsletterCampaign.objects.filter(pk=campaign.pk).update(
+        status="sending", started_at=campaign.started_at or timezone.now()
+    )
+
+    if processes:
+        batches = _render_batches_in_processes(
+            renderer, campaign.last_user_id, batch_size, chunk_size, processes
+        )
+    else:
+        batches = _render_batches(
+            renderer, campaign.last_user_id, batch_size, chunk_size
+        )
+
+    started = time.monotonic()
+    sent_this_run = 0
+    finished = True
+    try:
+        for last_user_id, users, messages in batches:
+            results = pool.send_messages(messages)
+            failed = 0
+            # Users handled, up to the first the mail server couldn't take
+            reached = len(users)
+            for i, (user, error) in enumerate(zip(users, results)):
+                if error is None:
+                    continue
+                if not is_rejection(error):
+                    logger.error(
+                        "Campaign %s paused, the mail server is unavailable: %s",
+                        campaign.pk,
+                        error,
+                    )
+                    reached = i
+                    break
+                failed += 1
+                logger.warning(
+                    "Campaign %s to %s failed: %s", campaign.pk, user.email, error
+                )
+            if reached < len(users):
+                last_user_id = (
+                    users[reached - 1].id if reached else campaign.last_user_id
+                )
+
+            # Checkpoint: the next run starts after the last user handled
+            NewsletterCampaign.objects.filter(pk=campaign.pk).update(
+                last_user_id=last_user_id,
+                sent_count=F("sent_count") + reached - failed,
+                failed_count=F("failed_count") + failed,
+            )
+            campaign.refresh_from_db()
+            progress(campaign)
+            if reached < len(users):
+                finished = False
+                break
+
+            sent_this_run += len(users)
+            if rate:
+                # Sleep off whatever the batch finished ahead of schedule
+                ahead = sent_this_run / rate - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+            if should_stop():
+                finished = False
+                break
+    finally:
+        # Shuts the render pool down if there is one
+        batches.close()
+
+    if finished:
+        NewsletterCampaign.objects.filter(pk=campaign.pk).update(
+            status="sent", finished_at=timezone.now()
+        )
+    else:
+        NewsletterCampaign.objects.filter(pk=campaign.pk).update(status="paused")
+    campaign.refresh_from_db()
+    return campaign
@@ -0,0 +1,82 @@
+import smtplib
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from users.models import NewsletterCampaign
+from users.newsletter import send_campaign
+
+
+class FakePool:
+    """Stands in for the SMTP connection pool, failing as told"""
+
+    def __init__(self, errors=None):
+        # Error to return by recipient address, None sends
+        self.errors = errors or {}
+        self.sent = []
+
+    def send_messages(self, messages):
+        results = []
+        for message in messages:
+            error = self.errors.get(message.to[0])
+            if error is None:
+                self.sent.append(message.to[0])
+            results.append(error)
+        return results
+
+
+class SendCampaignTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(f"reader{i}", f"reader{i}@example.com")
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        self.campaign = NewsletterCampaign.objects.create(
+            subject="News", body="<p>Hello {{ user.first_name }}</p>"
+        )
+
+    def send(self, pool):
+        with mock.patch("users.newsletter.get_connection_pool", return_value=pool):
+            return send_campaign(self.campaign, batch_size=3, processes=0)
+
+    def test_sends_to_every_subscriber(self):
+        pool = FakePool()
+        campaign = self.send(pool)
+        self.assertEqual(len(pool.sent), 5)
+        self.assertEqual(campaign.status, "sent")
+        self.assertEqual((campaign.sent_count, campaign.failed_count), (5, 0))
+
+    def test_rejected_recipients_count_as_failed(self):
+        refused = smtplib.SMTPRecipientsRefused({"reader1@example.com": (550, b"")})
+        with self.assertLogs("users.newsletter", "WARNING"):
+            campaign = self.send(FakePool({"reader1@example.com": refused}))
+        self.assertEqual(campaign.status, "sent")
+        self.assertEqual((campaign.sent_count, campaign.failed_count), (4, 1))
+
+    def test_unreachable_server_pauses(self):
+        down = ConnectionRefusedError("Connection refused")
+        pool = FakePool({user.email: down for user in self.users})
+        with self.assertLogs("users.newsletter", "ERROR"):
+            campaign = self.send(pool)
+        self.assertEqual(campaign.status, "paused")
+        self.assertEqual(campaign.last_user_id, 0)
+        self.assertEqual((campaign.sent_count, campaign.failed_count), (0, 0))
+
+    def test_resumes_after_the_last_user_reached(self):
+        # The connection drops at the fifth subscriber, in the second batch
+        dropped = smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        pool = FakePool({"reader4@example.com": dropped})
+        with self.assertLogs("users.newsletter", "ERROR"):
+            campaign = self.send(pool)
+        self.assertEqual(campaign.status, "paused")
+        self.assertEqual(campaign.last_user_id, self.users[3].id)
+        self.assertEqual((campaign.sent_count, campaign.failed_count), (4, 0))
+
+        pool = FakePool()
+        campaign = self.send(pool)
+        self.assertEqual(pool.sent, ["reader4@example.com"])
+        self.assertEqual(campaign.status, "sent")
+        self.assertEqual((campaign.sent_count, campaign.failed_count), (5, 0))